@@ -0,0 +1,170 @@
+import argparse
+import copy
+import os
+import time
+
+import numpy as np
+
+class IVFIndex:
+    """Inverted-file ANN index: gallery rows are bucketed by their nearest k-means
+    centroid and a search only scans the `nprobe` buckets closest to the query.
+    Raising `nprobe` trades latency for recall; nprobe == nlist is an exact scan."""
+
+    def __init__(self, nlist=None, nprobe=8, min_train_size=1000, iterations=10, seed=0):
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.iterations = iterations
+        self.seed = seed
+        self.centroids = None
+        self.assignments = np.zeros(0, dtype=np.int32)  # gallery row -> bucket
+        self.trained_size = 0
+        self._lists = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self, matrix):
+        """Runs spherical k-means over the normalized gallery and buckets every row"""
+        rng = np.random.default_rng(self.seed)
+        nlist = self.nlist or max(1, int(4 * np.sqrt(len(matrix))))
+        nlist = min(nlist, len(matrix))
+        sample = matrix
+        if len(matrix) > 64 * nlist:
+            sample = matrix[rng.choice(len(matrix), 64 * nlist, replace=False)]
+        centroids = sample[rng.choice(len(sample), nlist, replace=False)].copy()
+        for _ in range(self.iterations):
+            labels = (sample @ centroids.T).argmax(axis=1)
+            sums = np.zeros_like(centroids)
+            np.add.at(sums, labels, sample)
+            norms = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty buckets keep their previous centroid
+            filled = norms[:, 0] > 0
+            centroids[filled] = sums[filled] / norms[filled]
+        self.centroids = np.ascontiguousarray(centroids, dtype=np.float32)
+        self.assignments = self._assign(matrix)
+        self.trained_size = len(matrix)
+        self._lists = None
+
+    def _assign(self, vectors):
+        return (vectors @ self.centroids.T).argmax(axis=1).astype(np.int32)
+
+    def rebucketed(self, previous, matrix):
+        """Copy of the index for a rebuilt gallery, leaving this one untouched for
+        concurrent searches. previous[i] is row i's row in the old gallery, or -1
+        for a new or replaced embedding, which is bucketed afresh."""
+        index = copy.copy(self)
+        previous = np.asarray(previous, dtype=np.int64)
+        assignments = np.full(len(previous), -1, dtype=np.int32)
+        kept = previous >= 0
+        assignments[kept] = self.assignments[previous[kept]]
+        if (~kept).any():
+            assignments[~kept] = self._assign(matrix[~kept])
+        index.assignments = assignments
+        index._lists = None
+        return index
+
+    def _inverted_lists(self):
+        # Built lazily, on the first search after train(), rebucketed() or load()
+        if self._lists is None:
+            order = np.argsort(self.assignments, kind='stable').astype(np.int32)
+            offsets = np.zeros(len(self.centroids) + 1, dtype=np.int64)
+            np.cumsum(np.bincount(self.assignments, minlength=len(self.centroids)), out=offsets[1:])
+            self._lists = (order, offsets)
+        return self._lists
+
+    def search(self, queries, matrix, rerank=0, full=None):
+        """Returns the best gallery row and score for each normalized query. With
+        rerank > 0 and the float32 rows as `full`, the top `rerank` candidates scored
+        from `matrix` (e.g. a QuantizedGallery) are re-scored exactly."""
+        order, offsets = self._inverted_lists()
+        nprobe = min(self.nprobe, len(self.centroids))
+        probes = np.argpartition(-(queries @ self.centroids.T), nprobe - 1, axis=1)[:, :nprobe]
+        rows = np.full(len(queries), -1, dtype=np.int64)
+        scores = np.full(len(queries), -1.0, dtype=np.float32)
+        for i, (query, cells) in enumerate(zip(queries, probes)):
+            candidates = np.concatenate([order[offsets[c]:offsets[c + 1]] for c in cells])
+            if len(candidates) == 0:
+                continue
+            candidate_scores = matrix[candidates] @ query
+            if rerank and full is not None:
+                k = min(rerank, len(candidates))
+                top = np.argpartition(-candidate_scores, k - 1)[:k]
+                candidates = np.sort(candidates[top])  # ascending rows read a memmap sequentially
+                candidate_scores = np.asarray(full[candidates], dtype=np.float32) @ query
+            best = candidate_scores.argmax()
+            rows[i] = candidates[best]
+            scores[i] = candidate_scores[best]
+        return rows, scores
+
+    def save(self, path, names):
+        """Saves the index with the gallery names it was built for. Written to a
+        temporary file and renamed over `path`, so a loader never sees half a file."""
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, 'wb') as f:
+            np.savez(f, centroids=self.centroids, assignments=self.assignments,
+                     names=np.array(names), trained_size=self.trained_size)
+        os.replace(tmp, path)
+
+    def load(self, path, names, matrix):
+        """Loads a saved index, re-bucketing any rows the saved file did not know about"""
+        data = np.load(path)
+        self.centroids = data['centroids']
+        self.trained_size = int(data['trained_size'])
+        saved = dict(zip(data['names'].tolist(), data['assignments']))
+        assignments = np.array([saved.get(name, -1) for name in names], dtype=np.int32)
+        missing = assignments < 0
+        if missing.any():
+            assignments[missing] = self._assign(matrix[missing])
+        self.assignments = assignments
+        self._lists = None
+
+def recall_report(matrix, queries, nprobes, nlist=None, repeats=3):
+    """Prints recall@1 against the exact scan and per-query latency for each nprobe"""
+    start = time.perf_counter()
+    index = IVFIndex(nlist=nlist)
+    index.train(matrix)
+    print(f"Trained {len(index.centroids)} buckets over {len(matrix)} rows "
+          f"in {time.perf_counter() - start:.2f}s")
+
+    def timed(search):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = search()
+            best = min(best, time.perf_counter() - start)
+        return result, best * 1000 / len(queries)
+
+    exact_rows, exact_ms = timed(lambda: (queries @ matrix.T).argmax(axis=1))
+    print(f"{'nprobe':>8} {'recall@1':>9} {'ms/query':>9} {'speedup':>8}")
+    print(f"{'exact':>8} {1.0:>9.4f} {exact_ms:>9.3f} {1.0:>7.1f}x")
+    for nprobe in nprobes:
+        index.nprobe = nprobe
+        (rows, _), ms = timed(lambda: index.search(queries, matrix))
+        recall = np.mean(rows == exact_rows)
+        print(f"{nprobe:>8} {recall:>9.4f} {ms:>9.3f} {exact_ms / ms:>7.1f}x")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="IVF recall vs exact-scan report")
+    parser.add_argument('--db', help="face_db folder to use instead of a synthetic gallery")
+    parser.add_argument('--gallery', type=int, default=50000, help="synthetic gallery size")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--noise', type=float, default=0.05,
+                        help="per-dimension noise added to gallery rows to make queries")
+    parser.add_argument('--nlist', type=int)
+    parser.add_argument('--nprobe', default='1,2,4,8,16,32,64')
+    args = parser.parse_args()
+
+    from database_manager import FaceDatabase, normalize_embeddings
+    rng = np.random.default_rng(0)
+    if args.db:
+        matrix = FaceDatabase(args.db).embeddings
+    else:
+        # Identities drawn around a few hundred centres, like faces sharing demographics
+        centres = rng.normal(size=(256, 512))
+        matrix = normalize_embeddings(centres[rng.integers(0, 256, args.gallery)]
+                                      + rng.normal(size=(args.gallery, 512)) * 1.5)
+    picks = rng.integers(0, len(matrix), args.queries)
+    queries = normalize_embeddings(matrix[picks] + rng.normal(size=(args.queries, matrix.shape[1])) * args.noise)
+    recall_report(matrix, queries, [int(n) for n in args.nprobe.split(',')], nlist=args.nlist)
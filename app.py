@@ -1,9 +1,13 @@
 from flask import Flask, render_template, request, jsonify, Response
-import os
+import model_registry
 from webcam_app import process_webcam
+from frame_bus import frame_bus
+from broadcaster import get_broadcaster
+from detection_store import DetectionStore
+from metrics import metrics_registry
+from inference_server import get_scheduler
+import time
 import threading
-import cv2
-import numpy as np
 
 app = Flask(__name__)
 
@@ -11,13 +15,32 @@ app = Flask(__name__)
 DEVICE_CONFIGS = {
     "device1": {
         "passcode": "1234",
-        "ip": "http://192.168.0.61:8080/video"
+        "ip": "http://192.168.0.61:8080/video",
+        "priority": 1  # inference share; give cameras watching restricted zones more
     }
     # Add more devices as needed
 }
 
-# Global variable to store the current video stream
-current_stream = None
+# Analysis threads keyed by stream URL, which is also the camera id on the frame bus
+active_streams = {}
+# Camera shown by /video_feed when no ?camera= is given
+current_camera = None
+# Indexed read/rollup/retention access to detections.db, opened at startup
+detection_store = None
+_detection_store_lock = threading.Lock()
+
+def get_detection_store():
+    """Opens detections.db and starts its retention thread on first use"""
+    global detection_store
+    with _detection_store_lock:
+        if detection_store is None:
+            store = DetectionStore('detections.db')
+            store.start_retention()
+            detection_store = store
+    return detection_store
+
+# Model loading happens inside the analysis thread, so allow time for the first frame
+STREAM_START_TIMEOUT = 60.0
 
 @app.route('/')
 def index():
@@ -29,25 +52,58 @@ def stream_page():
 
 @app.route('/video_feed')
 def video_feed():
+    camera_id = request.args.get('camera', current_camera)
+    # Per-viewer caps, e.g. /video_feed?quality=60&max_width=640&fps=5 for a monitor wall
+    quality = min(max(request.args.get('quality', 80, type=int), 10), 95)
+    max_width = request.args.get('max_width', type=int)
+    max_fps = request.args.get('fps', type=float)
+
     def generate_frames():
-        global current_stream
-        while True:
-            if current_stream is not None:
-                ret, frame = current_stream.read()
-                if ret:
-                    # Convert frame to JPEG
-                    ret, buffer = cv2.imencode('.jpg', frame)
-                    frame = buffer.tobytes()
-                    yield (b'--frame\r\n'
-                           b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
-                else:
-                    break
-            else:
-                break
+        if camera_id is None:
+            return
+        # Annotated frames come from the analysis thread and are JPEG-encoded once for
+        # all viewers sharing the same quality and width
+        broadcaster = get_broadcaster(frame_bus, camera_id)
+        subscriber = broadcaster.subscribe(quality, max_width, max_fps)
+        viewers = metrics_registry.gauge("theft_video_feed_viewers", "Open /video_feed connections",
+                                         camera=camera_id)
+        sent = metrics_registry.counter("theft_video_feed_frames_total", "Frames sent to viewers",
+                                        camera=camera_id)
+        skipped = metrics_registry.counter("theft_video_feed_skipped_total",
+                                           "Frames replaced before a slow viewer picked them up",
+                                           camera=camera_id)
+        wait = metrics_registry.histogram("theft_video_feed_wait_seconds",
+                                          "Time a viewer waited for its next frame", camera=camera_id)
+        viewers.inc()
+        reported_skips = 0
+        try:
+            waiting_since = time.perf_counter()
+            for frame in subscriber.frames():
+                wait.observe(time.perf_counter() - waiting_since)
+                sent.inc()
+                skipped.inc(subscriber.skipped - reported_skips)
+                reported_skips = subscriber.skipped
+                yield (b'--frame\r\n'
+                       b'Content-Type: image/jpeg\r\n\r\n' + frame + b'\r\n')
+                waiting_since = time.perf_counter()
+        finally:
+            broadcaster.unsubscribe(subscriber)
+            viewers.dec()
 
     return Response(generate_frames(),
                     mimetype='multipart/x-mixed-replace; boundary=frame')
 
+@app.route('/metrics')
+def metrics():
+    """Per-camera runtime metrics in the Prometheus text format"""
+    return Response(metrics_registry.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/startup')
+def startup():
+    """Startup timeline: model loads, warmups and each camera's first frame"""
+    return jsonify([{'event': event, 'at': round(at, 3), 'took': None if took is None else round(took, 3)}
+                    for event, at, took in model_registry.startup_events()])
+
 @app.route('/verify_device', methods=['POST'])
 def verify_device():
     data = request.json
@@ -66,24 +122,115 @@ def verify_device():
 
 @app.route('/start_stream', methods=['POST'])
 def start_stream():
-    global current_stream
+    global current_camera
     data = request.json
     ip_address = data.get('ip_address')
     
-    # Initialize the video stream
-    current_stream = cv2.VideoCapture(ip_address)
-    if not current_stream.isOpened():
+    # Start headless webcam processing in a separate thread, once per stream
+    stream = active_streams.get(ip_address)
+    after_seq = 0
+    if stream is None or not stream[0].is_alive():
+        # Frames left over from an earlier run of this stream do not count
+        previous = frame_bus.latest(ip_address)
+        after_seq = previous[0] if previous is not None else 0
+        frame_bus.open(ip_address)
+        stop_event = threading.Event()
+        # Every stream shares one inference thread and one set of weights; the
+        # scheduler is resolved on the analysis thread so this request never
+        # waits on a model load
+        priority = data.get('priority') or next(
+            (config.get('priority', 1) for config in DEVICE_CONFIGS.values() if config['ip'] == ip_address), 1)
+        thread = threading.Thread(target=process_webcam, args=(ip_address,),
+                                  kwargs={'headless': True, 'camera_id': ip_address,
+                                          'stop_event': stop_event, 'scheduler': get_scheduler,
+                                          'weight': priority})
+        thread.daemon = True
+        thread.start()
+        active_streams[ip_address] = (thread, stop_event)
+    
+    # Wait for the first annotated frame before reporting success
+    if frame_bus.wait(ip_address, after_seq, timeout=STREAM_START_TIMEOUT) is None:
         return jsonify({
             'success': False,
             'message': 'Could not open video stream'
         })
     
-    # Start webcam processing in a separate thread
-    thread = threading.Thread(target=process_webcam, args=(ip_address,))
-    thread.daemon = True
-    thread.start()
-    
+    current_camera = ip_address
     return jsonify({'success': True})
 
+@app.route('/live_detections')
+def live_detections():
+    """Latest detection results published by the analysis thread"""
+    camera_id = request.args.get('camera', current_camera)
+    entry = frame_bus.latest(camera_id) if camera_id is not None else None
+    if entry is None:
+        return jsonify({'camera': camera_id, 'detections': []})
+    seq, _, detections, published_at = entry
+    return jsonify({
+        'camera': camera_id,
+        'seq': seq,
+        'timestamp': published_at,
+        'detections': detections
+    })
+
+def bad_cursor():
+    return jsonify({'success': False, 'message': 'cursor must be a next_cursor returned by this endpoint'}), 400
+
+def page_limit():
+    return min(max(request.args.get('limit', 100, type=int), 1), 1000)
+
+@app.route('/detections')
+def detections():
+    """Newest-first detections; pass the returned next_cursor as ?cursor= for the next page"""
+    violation = request.args.get('violation')
+    try:
+        page = get_detection_store().detections(
+            person=request.args.get('person'),
+            zone_type=request.args.get('zone'),
+            violation=None if violation is None else violation.lower() in ('1', 'true', 'yes'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            cursor=request.args.get('cursor'),
+            limit=page_limit())
+    except ValueError:
+        return bad_cursor()
+    return jsonify(page)
+
+@app.route('/violations')
+def violations():
+    """Newest-first violations; pass the returned next_cursor as ?cursor= for the next page"""
+    try:
+        page = get_detection_store().violations(
+            person=request.args.get('person'),
+            since=request.args.get('since'),
+            until=request.args.get('until'),
+            cursor=request.args.get('cursor'),
+            limit=page_limit())
+    except ValueError:
+        return bad_cursor()
+    return jsonify(page)
+
+@app.route('/detections/rollup')
+def detection_rollup():
+    """Per-minute or per-hour detection and violation counts"""
+    granularity = request.args.get('granularity', 'hour')
+    if granularity not in ('minute', 'hour'):
+        return jsonify({'success': False, 'message': 'granularity must be minute or hour'}), 400
+    return jsonify(get_detection_store().rollup(
+        granularity,
+        person=request.args.get('person'),
+        zone_type=request.args.get('zone'),
+        since=request.args.get('since'),
+        until=request.args.get('until')))
+
 if __name__ == '__main__':
-    app.run(debug=True, port=5000) 
\ No newline at end of file
+    # Load and warm the shared models (and start the inference scheduler on them)
+    # while the server starts accepting requests
+    def preload():
+        model_registry.preload()
+        get_scheduler()
+    get_detection_store()
+    threading.Thread(target=preload, daemon=True).start()
+    # The reloader would re-run this block in a child process, loading every model
+    # and starting every background thread twice
+    app.run(debug=True, port=5000, use_reloader=False) 
\ No newline at end of file
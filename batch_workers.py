@@ -0,0 +1,30 @@
+import os
+
+from embedding_cache import EmbeddingCache, read_image
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.webp')
+
+# Per-worker state, set once by init_worker
+worker_state = {}
+
+def load_image(path):
+    """Returns (image, raw file bytes), or (None, None) if the file can't be read or decoded"""
+    try:
+        image, data = read_image(path)
+    except OSError:
+        return None, None
+    if image is None:
+        return None, None
+    return image, data
+
+def pool_size(workers=None):
+    """Returns (worker processes, inference threads per worker); the CPU is split
+    between workers instead of every worker using every core"""
+    workers = workers or os.cpu_count() or 1
+    return workers, max(1, (os.cpu_count() or 1) // workers)
+
+def init_worker(profile, threads, cache_path):
+    """Loads the models and opens the embedding cache once per worker process"""
+    from face_recognizer import FaceRecognizer
+    worker_state['recognizer'] = FaceRecognizer(profile=profile, intra_op_threads=threads)
+    worker_state['cache'] = EmbeddingCache(cache_path) if cache_path else None
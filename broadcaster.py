@@ -0,0 +1,133 @@
+import queue
+import threading
+import time
+
+import cv2
+
+from metrics import metrics_registry
+
+class Subscriber:
+    """One viewer: a small queue of encoded JPEGs plus its own caps"""
+
+    def __init__(self, quality=80, max_width=None, max_fps=None, queue_size=1):
+        self.quality = quality
+        self.max_width = max_width
+        self.min_interval = 1.0 / max_fps if max_fps else 0.0
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.last_sent = 0.0
+        self.sent = 0
+        self.skipped = 0  # frames replaced before this viewer picked them up
+        self.closed = False
+
+    def due(self, now):
+        return now - self.last_sent >= self.min_interval
+
+    def offer(self, jpeg):
+        """Queues a frame without ever blocking; a slow viewer loses its oldest frame"""
+        while True:
+            try:
+                self.queue.put_nowait(jpeg)
+                self.sent += 1
+                return
+            except queue.Full:
+                try:
+                    self.queue.get_nowait()
+                    self.skipped += 1
+                except queue.Empty:
+                    pass
+
+    def frames(self, timeout=5.0):
+        """Yields encoded frames until the broadcaster ends or the viewer is closed"""
+        while not self.closed:
+            try:
+                jpeg = self.queue.get(timeout=timeout)
+            except queue.Empty:
+                continue
+            if jpeg is None:
+                return
+            yield jpeg
+
+class MJPEGBroadcaster:
+    """Reads one camera from the frame bus and encodes each frame once per distinct
+    (quality, max_width) among the viewers that are due, instead of once per viewer."""
+
+    def __init__(self, bus, camera_id):
+        self.bus = bus
+        self.camera_id = camera_id
+        self._subscribers = []
+        self._lock = threading.Lock()
+        self._thread = None
+        self.encodes = 0
+        self.frames = 0
+        self._encode_time = metrics_registry.histogram(
+            "theft_stage_latency_seconds", "Time spent in each pipeline stage",
+            camera=camera_id, stage="jpeg_encode")
+
+    def subscribe(self, quality=80, max_width=None, max_fps=None, queue_size=1):
+        subscriber = Subscriber(quality, max_width, max_fps, queue_size)
+        with self._lock:
+            self._subscribers.append(subscriber)
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, daemon=True)
+                self._thread.start()
+        return subscriber
+
+    def unsubscribe(self, subscriber):
+        subscriber.closed = True
+        with self._lock:
+            if subscriber in self._subscribers:
+                self._subscribers.remove(subscriber)
+
+    def _run(self):
+        seq = 0
+        while True:
+            with self._lock:
+                if not self._subscribers:
+                    self._thread = None
+                    return
+            entry = self.bus.wait(self.camera_id, seq, timeout=1.0)
+            if entry is None:
+                if self.bus.is_closed(self.camera_id):
+                    break
+                continue
+            seq, frame, _, _ = entry
+            self.frames += 1
+            now = time.monotonic()
+            with self._lock:
+                due = [s for s in self._subscribers if s.due(now)]
+            encoded = {}
+            for subscriber in due:
+                key = (subscriber.quality, subscriber.max_width)
+                if key not in encoded:
+                    encoded[key] = self._encode(frame, *key)
+                subscriber.last_sent = now
+                subscriber.offer(encoded[key])
+        # Camera ended: release every viewer
+        with self._lock:
+            subscribers, self._subscribers = self._subscribers, []
+            self._thread = None
+        for subscriber in subscribers:
+            subscriber.offer(None)
+
+    def _encode(self, frame, quality, max_width):
+        height, width = frame.shape[:2]
+        if max_width and width > max_width:
+            frame = cv2.resize(frame, (max_width, round(height * max_width / width)),
+                               interpolation=cv2.INTER_AREA)
+        self.encodes += 1
+        start = time.perf_counter()
+        _, buffer = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, int(quality)])
+        self._encode_time.observe(time.perf_counter() - start)
+        return buffer.tobytes()
+
+_broadcasters = {}
+_broadcasters_lock = threading.Lock()
+
+def get_broadcaster(bus, camera_id):
+    """Shared broadcaster per camera, so all viewers of a camera share its encodes"""
+    with _broadcasters_lock:
+        broadcaster = _broadcasters.get(camera_id)
+        if broadcaster is None or broadcaster.bus is not bus:
+            broadcaster = MJPEGBroadcaster(bus, camera_id)
+            _broadcasters[camera_id] = broadcaster
+        return broadcaster
@@ -77,9 +77,7 @@
 #     main()
 import cv2
 import numpy as np
-from face_detector import FaceDetector
-from face_recognizer import FaceRecognizer
-from database_manager import FaceDatabase
+from model_registry import get_recognizer, get_database
 from zones import ZONES, ZONE_COLORS, ACCESS_LEVELS
 
 def draw_zones(frame):
@@ -112,9 +110,8 @@ def check_access(name, bbox):
     return None
 
 def main():
-    detector = FaceDetector()
-    recognizer = FaceRecognizer()
-    database = FaceDatabase()
+    recognizer = get_recognizer()
+    database = get_database()
     
     cap = cv2.VideoCapture(0)
     cap.set(cv2.CAP_PROP_FRAME_WIDTH, 1920)
@@ -128,9 +125,9 @@ def main():
         frame = draw_zones(frame)
         faces = recognizer.model.get(frame)
         
-        for face in faces:
+        matches = database.recognize_faces([face.embedding for face in faces])
+        for face, (name, score) in zip(faces, matches):
             bbox = face.bbox.astype(int)
-            name = database.recognize_face(face.embedding)
             
             # Zone access check
             alert = check_access(name, bbox)
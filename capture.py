@@ -0,0 +1,136 @@
+import threading
+import time
+from collections import deque
+
+import cv2
+
+class LatestFrameCapture:
+    """Decodes a video source on its own thread into a small "latest frame wins"
+    buffer, so a slow consumer always gets the freshest frame instead of working
+    through a backlog queued inside OpenCV. A network stream (a URL) that stops
+    delivering is reopened every `reconnect_delay` seconds instead of ending; a local
+    camera or a video file ends at its first failed read."""
+
+    def __init__(self, source, buffer_size=1, reconnect_delay=2.0):
+        self.source = source
+        self.reconnect_delay = reconnect_delay
+        self._reconnect = isinstance(source, str) and '://' in source
+        self.cap = self._open()
+        self._frames = deque(maxlen=buffer_size)
+        self._cond = threading.Condition()
+        self._running = False
+        self._stopped = threading.Event()
+        self._ended = False
+        self._thread = None
+        # Counters
+        self.reconnects = 0
+        self.frames_captured = 0
+        self.frames_dropped = 0  # decoded but replaced by a newer frame before being read
+        self.frames_read = 0
+        self.staleness_total = 0.0  # capture -> pickup by the consumer
+        self.staleness_max = 0.0
+        self.latency_total = 0.0  # capture -> end of processing, via record_latency
+        self.latency_max = 0.0
+        self.latency_count = 0
+
+    def _open(self):
+        cap = cv2.VideoCapture(self.source)
+        # Keep OpenCV's own queue as short as the backend allows
+        cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+        return cap
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    def frame_valid(self):
+        """Frames are handed over to the consumer, so they are never overwritten"""
+        return True
+
+    @property
+    def ended(self):
+        """True once the source will deliver no more frames"""
+        return self._ended and not self._frames
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _run(self):
+        try:
+            while self._running:
+                ret, frame = self.cap.read()
+                captured_at = time.monotonic()
+                if not ret and self._reconnect:
+                    self.cap.release()
+                    if self._stopped.wait(self.reconnect_delay):
+                        break
+                    self.reconnects += 1
+                    print(f"🔄 Reconnecting to {self.source} (attempt {self.reconnects})")
+                    self.cap = self._open()
+                    continue
+                with self._cond:
+                    if not ret:
+                        break
+                    if len(self._frames) == self._frames.maxlen:
+                        self.frames_dropped += 1
+                    self._frames.append((captured_at, frame))
+                    self.frames_captured += 1
+                    self._cond.notify_all()
+        finally:
+            # Released here, after the last read, so release() never pulls the
+            # capture out from under a read that is still blocked
+            self.cap.release()
+            with self._cond:
+                self._ended = True
+                self._cond.notify_all()
+
+    def read(self, timeout=5.0):
+        """Returns (ret, frame, captured_at) for the newest frame, waiting up to
+        `timeout` for one. A failed read with `ended` still False is only a stall."""
+        with self._cond:
+            if not self._cond.wait_for(lambda: self._frames or self._ended, timeout):
+                return False, None, None
+            if not self._frames:
+                return False, None, None
+            captured_at, frame = self._frames.pop()
+            # Anything older than the frame we just took is never going to be used
+            self.frames_dropped += len(self._frames)
+            self._frames.clear()
+            self.frames_read += 1
+            staleness = time.monotonic() - captured_at
+            self.staleness_total += staleness
+            self.staleness_max = max(self.staleness_max, staleness)
+        return True, frame, captured_at
+
+    def record_latency(self, captured_at):
+        """Records end-to-end latency once the consumer has finished with a frame"""
+        latency = time.monotonic() - captured_at
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_count += 1
+
+    def stats(self):
+        """Returns dropped-frame and staleness counters"""
+        return {
+            'reconnects': self.reconnects,
+            'captured': self.frames_captured,
+            'read': self.frames_read,
+            'dropped': self.frames_dropped,
+            'drop_rate': self.frames_dropped / max(self.frames_captured, 1),
+            'staleness_avg_ms': 1000 * self.staleness_total / max(self.frames_read, 1),
+            'staleness_max_ms': 1000 * self.staleness_max,
+            'latency_avg_ms': 1000 * self.latency_total / max(self.latency_count, 1),
+            'latency_max_ms': 1000 * self.latency_max,
+        }
+
+    def release(self):
+        """Stops the decode thread; it releases the capture itself once its current
+        read returns, which for a hung network stream can be after this returns"""
+        self._running = False
+        self._stopped.set()
+        if self._thread is None:
+            self.cap.release()
+            return
+        self._thread.join(timeout=2.0)
@@ -1,31 +1,309 @@
-import numpy as np
+import copy
 import os
-from sklearn.metrics.pairwise import cosine_similarity
+import threading
+
+import numpy as np
+from ann_index import IVFIndex
+from gallery_store import PackedGallery
+from quantized_gallery import QuantizedGallery
+
+EMBEDDING_DIM = 512
+
+def normalize_embeddings(embeddings):
+    """L2-normalizes embeddings row-wise as float32 so a dot product is the cosine similarity"""
+    embeddings = np.atleast_2d(np.asarray(embeddings, dtype=np.float32))
+    norms = np.linalg.norm(embeddings, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return embeddings / norms
+
+class GallerySnapshot:
+    """Immutable gallery state: names, their read-only normalized matrix and the ANN
+    index built for exactly these rows. FaceDatabase swaps whole snapshots, so a
+    reader holding one always sees a consistent gallery."""
+
+    def __init__(self, names, embeddings, index=None, sources=None, quantized=None):
+        self.names = tuple(names)
+        self.embeddings = np.ascontiguousarray(embeddings, dtype=np.float32)
+        self.embeddings.flags.writeable = False
+        self.rows = {name: i for i, name in enumerate(self.names)}
+        self.index = index
+        self.quantized = quantized
+        # Where each identity was loaded from: packed file row or .npy (mtime, size)
+        self.sources = dict(sources or {})
 
 class FaceDatabase:
-    def __init__(self, db_folder='face_db'):
+    def __init__(self, db_folder='face_db', use_ann=False, nprobe=8, ann_nlist=None, quantize=None, rerank=10):
         self.db_folder = db_folder
+        # Optional 'float16'/'int8' copy of the gallery used for matching; the top
+        # `rerank` candidates are re-scored against the float32 rows (0 disables)
+        self.quantize = quantize
+        self.rerank = rerank
         os.makedirs(db_folder, exist_ok=True)
-        self.known_faces = self._load_known_faces()
+        # Writers (add/remove/reload) serialize on this lock; recognition never takes it
+        self._write_lock = threading.Lock()
+        self._watcher = None
+        self._stop_watching = threading.Event()
+        self._snapshot = GallerySnapshot([], np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+        # Packed memory-mapped store, unless the folder still holds per-person .npy files
+        self.store = None
+        self._offset = 0  # bytes of gallery.jsonl already applied
+        self._total_rows = 0
+        if PackedGallery.exists(db_folder) or not any(f.endswith('.npy') for f in os.listdir(db_folder)):
+            self.store = PackedGallery(db_folder)
+        # Optional approximate index; nprobe is the recall/latency knob
+        self._index = IVFIndex(nlist=ann_nlist, nprobe=nprobe) if use_ann else None
+        if quantize and self.store is None:
+            print(f"⚠️ {db_folder} is a .npy folder: its float32 rows stay in RAM next to the "
+                  f"{quantize} copy. Run 'python gallery_store.py migrate {db_folder}' to memory-map them.")
+        self._load_known_faces()
 
     def _load_known_faces(self):
-        """Loads all .npy files from face_db folder"""
-        db = {}
-        for file in os.listdir(self.db_folder):
+        """Opens the packed gallery, or loads all .npy files from face_db folder"""
+        with self._write_lock:
+            if self.store is not None:
+                self._reload_packed()
+            else:
+                self._reload_npy()
+
+    # Readers: every attribute comes from one snapshot
+
+    @property
+    def snapshot(self):
+        return self._snapshot
+
+    @property
+    def names(self):
+        return self._snapshot.names
+
+    @property
+    def embeddings(self):
+        return self._snapshot.embeddings
+
+    @property
+    def index(self):
+        return self._snapshot.index
+
+    def memory_usage(self):
+        """Gallery bytes held in RAM: float32 rows unless they are a memmap of the packed
+        store (paged in on demand), plus the quantized copy"""
+        snapshot = self._snapshot
+        base = snapshot.embeddings
+        while base is not None and not isinstance(base, np.memmap):
+            base = base.base
+        float32 = 0 if base is not None else snapshot.embeddings.nbytes
+        quantized = snapshot.quantized.nbytes if snapshot.quantized is not None else 0
+        identities = len(snapshot.names)
+        return {'identities': identities, 'float32_bytes': float32, 'quantized_bytes': quantized,
+                'bytes_per_identity': (float32 + quantized) / max(identities, 1)}
+
+    @property
+    def known_faces(self):
+        """Name -> normalized embedding mapping, kept for older callers"""
+        snapshot = self._snapshot
+        return dict(zip(snapshot.names, snapshot.embeddings))
+
+    # Writers: build a new snapshot off to the side, then swap it in
+
+    def _index_path(self):
+        return os.path.join(self.db_folder, 'ann_index.npz')
+
+    def _publish(self, names, matrix, sources, changed=()):
+        """Builds the next snapshot from names/matrix and swaps it in with a single
+        reference assignment (read-copy-update). `changed` holds names whose
+        embedding is new or replaced. Returns (added, replaced, removed) counts."""
+        old = self._snapshot
+        index = self._next_index(old, names, matrix, changed)
+        quantized = QuantizedGallery(matrix, self.quantize) if self.quantize and len(names) else None
+        self._snapshot = GallerySnapshot(names, matrix, index, sources, quantized)
+        added = sum(1 for name in names if name not in old.rows)
+        replaced = sum(1 for name in changed if name in old.rows)
+        return added, replaced, len(old.names) + added - len(names)
+
+    def _next_index(self, old, names, matrix, changed):
+        """Trains the ANN index once the gallery is large enough (and again each time it
+        quadruples), otherwise re-buckets only new or changed rows. Always works on a
+        copy; searches keep using the old snapshot's index."""
+        if self._index is None:
+            return None
+        index = old.index
+        if index is None:
+            # First load: reuse the saved index when there is one
+            index = copy.copy(self._index)
+            if os.path.exists(self._index_path()):
+                index.load(self._index_path(), names, matrix)
+                old = GallerySnapshot(names, matrix, index)
+                changed = ()
+        size = len(names)
+        if size >= max(index.min_train_size, 4 * index.trained_size):
+            index = copy.copy(index)
+            index.train(matrix)
+        elif not index.is_trained:
+            return index
+        else:
+            previous = [old.rows[name] if name in old.rows and name not in changed else -1
+                        for name in names]
+            if previous == list(range(len(old.names))):
+                return index  # nothing moved
+            index = index.rebucketed(previous, matrix)
+        return index
+
+    def _save_index(self):
+        """Saves the current index beside the gallery. Only the process that wrote to
+        the gallery does this; watchers just rebuild their in-memory copy."""
+        snapshot = self._snapshot
+        if snapshot.index is not None and snapshot.index.is_trained:
+            snapshot.index.save(self._index_path(), snapshot.names)
+
+    def _reload_packed(self):
+        """Applies gallery.jsonl records appended since the last load. Appends of new
+        identities re-map the grown file with no copy; replacements and removals
+        rebuild the matrix from the memmap. A rewritten (shrunk) file is reloaded whole."""
+        if os.path.exists(self.store.index_path) and os.path.getsize(self.store.index_path) < self._offset:
+            self._offset, self._total_rows = 0, 0
+            self._snapshot = GallerySnapshot([], np.zeros((0, EMBEDDING_DIM), dtype=np.float32))
+        records, offset = self.store.read_records_since(self._offset)
+        if not records:
+            self._offset = offset
+            return None
+        old = self._snapshot
+        entries = PackedGallery.fold(records, old.sources)
+        self._total_rows += PackedGallery.matrix_rows(records)
+        self._offset = offset
+        names, rows = list(entries), list(entries.values())
+        matrix = self.store.gallery_matrix(rows, self._total_rows)
+        changed = {name for name, row in entries.items() if old.sources.get(name) != row}
+        return self._publish(names, matrix, entries, changed)
+
+    def _reload_npy(self):
+        """Loads only .npy files that are new or whose mtime/size changed, and drops
+        identities whose file was deleted"""
+        old = self._snapshot
+        sources = {}
+        for file in sorted(os.listdir(self.db_folder)):
             if file.endswith('.npy'):
-                name = os.path.splitext(file)[0]
-                db[name] = np.load(os.path.join(self.db_folder, file))
-        return db
+                stat = os.stat(os.path.join(self.db_folder, file))
+                sources[os.path.splitext(file)[0]] = (stat.st_mtime_ns, stat.st_size)
+        changed = {name for name, source in sources.items() if old.sources.get(name) != source}
+        if not changed and len(sources) == len(old.sources):
+            return None
+        # Existing identities keep their position, new ones are appended in file order
+        names = [name for name in old.names if name in sources]
+        names += sorted(name for name in changed if name not in old.rows)
+        vectors = {}
+        for name in changed:
+            try:
+                vectors[name] = normalize_embeddings(np.load(os.path.join(self.db_folder, f"{name}.npy")).ravel())[0]
+            except (OSError, ValueError):
+                # Still being written; picked up on the next reload
+                sources.pop(name)
+                if name not in old.rows:
+                    names.remove(name)
+        matrix = np.zeros((len(names), EMBEDDING_DIM), dtype=np.float32)
+        for i, name in enumerate(names):
+            matrix[i] = vectors[name] if name in vectors else old.embeddings[old.rows[name]]
+        return self._publish(names, matrix, {name: sources.get(name, old.sources.get(name)) for name in names},
+                             set(vectors))
+
+    def reload(self):
+        """Picks up changes made by other processes (enrollment, removal). Returns
+        (added, replaced, removed) counts, or None when nothing changed."""
+        with self._write_lock:
+            return self._reload_packed() if self.store is not None else self._reload_npy()
+
+    def watch(self, interval=2.0):
+        """Polls the store every `interval` seconds on a daemon thread and swaps in
+        new snapshots, so running streams see enrollments and revocations without a restart"""
+        if self._watcher is not None:
+            return self
+        self._stop_watching.clear()
+
+        def run():
+            while not self._stop_watching.wait(interval):
+                try:
+                    result = self.reload()
+                except Exception as e:
+                    print(f"Gallery reload failed: {e}")
+                    continue
+                if result:
+                    added, replaced, removed = result
+                    print(f"🔄 Gallery reloaded: {added} added, {replaced} updated, {removed} removed "
+                          f"({len(self.names)} identities)")
+
+        self._watcher = threading.Thread(target=run, daemon=True)
+        self._watcher.start()
+        return self
+
+    def stop_watching(self):
+        self._stop_watching.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
 
     def add_face(self, name, embedding):
         """Adds new face to database"""
-        np.save(os.path.join(self.db_folder, f"{name}.npy"), embedding)
-        self.known_faces[name] = embedding
+        self.add_faces([name], [embedding])
+
+    def add_faces(self, names, embeddings):
+        """Adds or replaces several faces with a single gallery update"""
+        if not names:
+            return
+        with self._write_lock:
+            if self.store is not None:
+                # One append-only write, then fold in just the new records
+                self.store.append(names, normalize_embeddings(np.stack([np.ravel(e) for e in embeddings])))
+                self._reload_packed()
+            else:
+                for name, embedding in zip(names, embeddings):
+                    np.save(os.path.join(self.db_folder, f"{name}.npy"), embedding)
+                self._reload_npy()
+            self._save_index()
+
+    def remove_face(self, name):
+        """Removes a face from the database"""
+        self.remove_faces([name])
+
+    def remove_faces(self, names):
+        """Revokes identities: tombstones in the packed store, deleted .npy files otherwise.
+        Watching processes drop them on their next reload."""
+        with self._write_lock:
+            names = [name for name in names if name in self._snapshot.rows]
+            if not names:
+                return 0
+            if self.store is not None:
+                self.store.remove(names)
+                self._reload_packed()
+            else:
+                for name in names:
+                    os.remove(os.path.join(self.db_folder, f"{name}.npy"))
+                self._reload_npy()
+            self._save_index()
+            return len(names)
+
+    def recognize_faces(self, embeddings, threshold=0.6):
+        """Returns the best (name, score) for each embedding, scored against the whole gallery at once"""
+        if len(embeddings) == 0:
+            return []
+        queries = normalize_embeddings(np.stack([np.ravel(e) for e in embeddings]))
+        # One snapshot for the whole call; a concurrent reload swaps in a new one
+        snapshot = self._snapshot
+        if not snapshot.names:
+            return [("Unknown", 0.0)] * len(queries)
+        if snapshot.index is not None and snapshot.index.is_trained:
+            if snapshot.quantized is not None:
+                # Candidates are scored from the quantized rows, the best re-scored exactly
+                best, best_scores = snapshot.index.search(queries, snapshot.quantized, self.rerank,
+                                                          snapshot.embeddings)
+            else:
+                best, best_scores = snapshot.index.search(queries, snapshot.embeddings)
+        elif snapshot.quantized is not None:
+            best, best_scores = snapshot.quantized.search(queries, self.rerank, snapshot.embeddings)
+        else:
+            scores = queries @ snapshot.embeddings.T
+            best = scores.argmax(axis=1)
+            best_scores = scores[np.arange(len(best)), best]
+        return [(snapshot.names[i] if score > threshold else "Unknown", float(score))
+                for i, score in zip(best, best_scores)]
 
     def recognize_face(self, embedding, threshold=0.6):
         """Returns recognized name or 'Unknown'"""
-        for name, known_embedding in self.known_faces.items():
-            similarity = cosine_similarity([embedding], [known_embedding])[0][0]
-            if similarity > threshold:
-                return name
-        return "Unknown"
\ No newline at end of file
+        return self.recognize_faces([embedding], threshold)[0][0]
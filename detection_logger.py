@@ -0,0 +1,180 @@
+import argparse
+import atexit
+import json
+import os
+import queue
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from detection_store import connect, update_rollups
+
+INSERT_DETECTION = """INSERT INTO detections (timestamp, person_name, access_status, zone_type,
+    is_violation, confidence, location_x, location_y, additional_data)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"""
+INSERT_VIOLATION = """INSERT INTO violations (timestamp, person_name, zone_type, violation_type, details)
+    VALUES (?, ?, ?, ?, ?)"""
+
+def timestamp_now():
+    return datetime.now().isoformat(sep=' ', timespec='milliseconds')
+
+class DetectionLogger:
+    """Queues detection and violation rows from the pipeline and commits them from a
+    background thread in batched transactions. The log_* calls never touch the disk;
+    when the queue is full (disk stalled) rows are dropped and counted instead."""
+
+    def __init__(self, db_path='detections.db', batch_size=500, flush_interval=0.5, max_queue=10000):
+        self.db_path = db_path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._stop = threading.Event()
+        self._thread = None
+        # Counters; log_* runs on every camera thread, so updates take this lock
+        self._lock = threading.Lock()
+        self.queued = 0
+        self.dropped = 0
+        self.written = 0
+        self.batches = 0
+        self.errors = 0
+
+    def start(self):
+        # Connect on the caller's thread so a bad path fails loudly here
+        self._conn = connect(self.db_path)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _put(self, item):
+        try:
+            self._queue.put_nowait(item)
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            return False
+        with self._lock:
+            self.queued += 1
+        return True
+
+    def log_detection(self, person_name, access_status, zone_type, is_violation, confidence=None,
+                      location=(None, None), additional_data=None, timestamp=None):
+        """Queues a detections row; returns False if it had to be dropped"""
+        if additional_data is not None and not isinstance(additional_data, str):
+            additional_data = json.dumps(additional_data)
+        return self._put(('detection', (timestamp or timestamp_now(), person_name, access_status,
+                                        zone_type, bool(is_violation), confidence,
+                                        location[0], location[1], additional_data)))
+
+    def log_violation(self, person_name, zone_type, violation_type, details=None, timestamp=None):
+        """Queues a violations row; returns False if it had to be dropped"""
+        if details is not None and not isinstance(details, str):
+            details = json.dumps(details)
+        return self._put(('violation', (timestamp or timestamp_now(), person_name, zone_type,
+                                        violation_type, details)))
+
+    @property
+    def backlog(self):
+        return self._queue.qsize()
+
+    def _next_batch(self):
+        """Waits up to flush_interval for the first row, then drains up to batch_size"""
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval)]
+        except queue.Empty:
+            return []
+        while len(batch) < self.batch_size:
+            try:
+                batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, batch):
+        detections = [row for kind, row in batch if kind == 'detection']
+        violations = [row for kind, row in batch if kind == 'violation']
+        try:
+            # One transaction per batch; executemany reuses the prepared statement
+            with self._conn:
+                if detections:
+                    self._conn.executemany(INSERT_DETECTION, detections)
+                    update_rollups(self._conn, detections)
+                if violations:
+                    self._conn.executemany(INSERT_VIOLATION, violations)
+            with self._lock:
+                self.written += len(batch)
+                self.batches += 1
+        except sqlite3.Error as e:
+            with self._lock:
+                self.errors += 1
+                self.dropped += len(batch)
+            print(f"Error writing detections: {e}")
+
+    def _run(self):
+        while not (self._stop.is_set() and self._queue.empty()):
+            batch = self._next_batch()
+            if batch:
+                self._write(batch)
+
+    def close(self):
+        """Flushes everything still queued and stops the writer; safe to call twice"""
+        if self._stop.is_set():
+            return
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self._conn.close()
+
+    def stats(self):
+        with self._lock:
+            return {'queued': self.queued, 'written': self.written, 'dropped': self.dropped,
+                    'backlog': self.backlog, 'batches': self.batches, 'errors': self.errors}
+
+_loggers = {}
+_loggers_lock = threading.Lock()
+
+def get_detection_logger(db_path='detections.db'):
+    """Process-wide writer per database, shared by every camera thread"""
+    with _loggers_lock:
+        if db_path not in _loggers:
+            _loggers[db_path] = DetectionLogger(db_path).start()
+            # The writer is a daemon thread; flush what is still queued on exit
+            atexit.register(_loggers[db_path].close)
+        return _loggers[db_path]
+
+def benchmark(rows=100000, batch_size=500):
+    """Measures producer-side and committed inserts/sec against a row-per-commit baseline"""
+    with tempfile.TemporaryDirectory() as tmp:
+        logger = DetectionLogger(os.path.join(tmp, 'bench.db'), batch_size=batch_size,
+                                 max_queue=rows).start()
+        start = time.perf_counter()
+        for i in range(rows):
+            logger.log_detection("person", "ALLOWED", "general", False, 0.9, (i % 800, i % 600),
+                                 {"camera": "bench", "track_id": i})
+        enqueued = time.perf_counter() - start
+        logger.close()
+        committed = time.perf_counter() - start
+        print(f"Batched writer: {rows / enqueued:,.0f} rows/s enqueued, "
+              f"{rows / committed:,.0f} rows/s committed "
+              f"({logger.batches} batches, {logger.dropped} dropped)")
+
+        baseline_rows = min(rows, 2000)
+        conn = connect(os.path.join(tmp, 'baseline.db'))
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.execute("PRAGMA synchronous=FULL")
+        start = time.perf_counter()
+        for i in range(baseline_rows):
+            with conn:
+                conn.execute(INSERT_DETECTION, (timestamp_now(), "person", "ALLOWED", "general",
+                                                False, 0.9, i % 800, i % 600, None))
+        elapsed = time.perf_counter() - start
+        conn.close()
+        print(f"Row-per-commit baseline: {baseline_rows / elapsed:,.0f} rows/s committed")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Detection logger throughput benchmark")
+    parser.add_argument('--rows', type=int, default=100000)
+    parser.add_argument('--batch-size', type=int, default=500)
+    args = parser.parse_args()
+    benchmark(args.rows, args.batch_size)
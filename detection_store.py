@@ -0,0 +1,221 @@
+import sqlite3
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+# Same schema as the shipped detections.db, so a fresh database works too
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS detections (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp DATETIME NOT NULL,
+    person_name TEXT NOT NULL,
+    access_status TEXT NOT NULL,
+    zone_type TEXT NOT NULL,
+    is_violation BOOLEAN NOT NULL,
+    confidence FLOAT,
+    location_x INTEGER,
+    location_y INTEGER,
+    additional_data TEXT
+);
+CREATE TABLE IF NOT EXISTS violations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    timestamp DATETIME NOT NULL,
+    person_name TEXT NOT NULL,
+    zone_type TEXT NOT NULL,
+    violation_type TEXT NOT NULL,
+    details TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_detections_timestamp ON detections (timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_person ON detections (person_name, timestamp);
+CREATE INDEX IF NOT EXISTS idx_detections_zone ON detections (zone_type, is_violation, timestamp);
+CREATE INDEX IF NOT EXISTS idx_violations_timestamp ON violations (timestamp);
+CREATE INDEX IF NOT EXISTS idx_violations_person ON violations (person_name, timestamp);
+"""
+
+# Rollup buckets are timestamp prefixes: 'YYYY-MM-DD HH:MM' and 'YYYY-MM-DD HH'
+ROLLUPS = {"minute": ("detection_rollup_minute", 16), "hour": ("detection_rollup_hour", 13)}
+
+ROLLUP_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    bucket TEXT NOT NULL,
+    person_name TEXT NOT NULL,
+    zone_type TEXT NOT NULL,
+    detections INTEGER NOT NULL,
+    violations INTEGER NOT NULL,
+    PRIMARY KEY (bucket, person_name, zone_type)
+) WITHOUT ROWID;
+"""
+
+UPSERT_ROLLUP = """INSERT INTO {table} (bucket, person_name, zone_type, detections, violations)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (bucket, person_name, zone_type) DO UPDATE SET
+        detections = detections + excluded.detections,
+        violations = violations + excluded.violations"""
+
+def ensure_schema(conn):
+    """Creates tables, indexes and rollups; rollups start from any existing history"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")}
+    conn.executescript(SCHEMA)
+    for table, length in ROLLUPS.values():
+        if table in existing:
+            continue
+        conn.executescript(ROLLUP_SCHEMA.format(table=table))
+        with conn:
+            conn.execute(f"""INSERT INTO {table}
+                SELECT substr(timestamp, 1, {length}), person_name, zone_type,
+                       COUNT(*), SUM(is_violation)
+                FROM detections GROUP BY 1, 2, 3""")
+
+def connect(db_path):
+    """Opens the database in WAL mode so readers never wait on the writer"""
+    conn = sqlite3.connect(db_path, timeout=30.0, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    ensure_schema(conn)
+    return conn
+
+def update_rollups(conn, detection_rows):
+    """Adds a batch of detections rows (timestamp, person, status, zone, is_violation, ...)
+    to the minute and hour rollups; call inside the transaction that inserts them"""
+    for table, length in ROLLUPS.values():
+        counts = Counter()
+        violations = Counter()
+        for row in detection_rows:
+            key = (row[0][:length], row[1], row[3])
+            counts[key] += 1
+            violations[key] += int(bool(row[4]))
+        conn.executemany(UPSERT_ROLLUP.format(table=table),
+                         [key + (count, violations[key]) for key, count in counts.items()])
+
+def encode_cursor(row):
+    return f"{row['timestamp']}|{row['id']}"
+
+def decode_cursor(cursor):
+    """Inverse of encode_cursor; raises ValueError for a cursor it did not produce"""
+    timestamp, sep, row_id = cursor.rpartition('|')
+    if not sep or not timestamp:
+        raise ValueError(f"Invalid cursor {cursor!r}")
+    return timestamp, int(row_id)
+
+class DetectionStore:
+    """Read, rollup and retention access to detections.db. Listing is newest first with
+    keyset pagination on (timestamp, id), so every page is an index range scan."""
+
+    def __init__(self, db_path='detections.db'):
+        self.db_path = db_path
+        self._local = threading.local()
+        self._retention_thread = None
+        connect(db_path).close()
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30.0)
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def _page(self, table, filters, params, since, until, cursor, limit):
+        if since:
+            filters.append("timestamp >= ?")
+            params.append(since)
+        if until:
+            filters.append("timestamp < ?")
+            params.append(until)
+        if cursor:
+            timestamp, row_id = decode_cursor(cursor)
+            filters.append("(timestamp, id) < (?, ?)")
+            params.extend([timestamp, row_id])
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        rows = self._conn().execute(
+            f"SELECT * FROM {table} {where} ORDER BY timestamp DESC, id DESC LIMIT ?",
+            params + [limit + 1]).fetchall()
+        items = [dict(row) for row in rows[:limit]]
+        next_cursor = encode_cursor(items[-1]) if len(rows) > limit else None
+        return {'items': items, 'next_cursor': next_cursor}
+
+    def detections(self, person=None, zone_type=None, violation=None, since=None, until=None,
+                   cursor=None, limit=100):
+        """One page of detections, newest first, plus the cursor for the next page"""
+        filters, params = [], []
+        if person is not None:
+            filters.append("person_name = ?")
+            params.append(person)
+        if zone_type is not None:
+            filters.append("zone_type = ?")
+            params.append(zone_type)
+        if violation is not None:
+            filters.append("is_violation = ?")
+            params.append(int(bool(violation)))
+        return self._page("detections", filters, params, since, until, cursor, limit)
+
+    def violations(self, person=None, since=None, until=None, cursor=None, limit=100):
+        """One page of violations, newest first, plus the cursor for the next page"""
+        filters, params = [], []
+        if person is not None:
+            filters.append("person_name = ?")
+            params.append(person)
+        return self._page("violations", filters, params, since, until, cursor, limit)
+
+    def rollup(self, granularity='hour', person=None, zone_type=None, since=None, until=None):
+        """Detection and violation counts per bucket from the rollup tables"""
+        table, length = ROLLUPS[granularity]
+        filters, params = [], []
+        for column, value in (("person_name", person), ("zone_type", zone_type)):
+            if value is not None:
+                filters.append(f"{column} = ?")
+                params.append(value)
+        if since:
+            filters.append("bucket >= ?")
+            params.append(since[:length])
+        if until:
+            filters.append("bucket < ?")
+            params.append(until[:length])
+        where = f"WHERE {' AND '.join(filters)}" if filters else ""
+        rows = self._conn().execute(
+            f"""SELECT bucket, SUM(detections) AS detections, SUM(violations) AS violations
+                FROM {table} {where} GROUP BY bucket ORDER BY bucket""", params).fetchall()
+        return [dict(row) for row in rows]
+
+    def prune(self, detections_days=30, minute_rollup_days=7, hour_rollup_days=365,
+              batch_size=1000, pause=0.05):
+        """Deletes expired rows in small batches, each its own short transaction, so the
+        writer is never locked out for long. Returns rows deleted per table."""
+        now = datetime.now()
+        cutoff = lambda days: (now - timedelta(days=days)).isoformat(sep=' ', timespec='milliseconds')
+        row_delete = "DELETE FROM {table} WHERE id IN (SELECT id FROM {table} WHERE timestamp < ? ORDER BY timestamp LIMIT ?)"
+        # Rollups are WITHOUT ROWID, so they are deleted a batch of buckets at a time
+        bucket_delete = ("DELETE FROM {table} WHERE bucket IN (SELECT DISTINCT bucket FROM {table} "
+                         "WHERE bucket < ? ORDER BY bucket LIMIT ?)")
+        plan = [
+            ("detections", row_delete, cutoff(detections_days)),
+            ("violations", row_delete, cutoff(detections_days)),
+            (ROLLUPS["minute"][0], bucket_delete, cutoff(minute_rollup_days)[:ROLLUPS["minute"][1]]),
+            (ROLLUPS["hour"][0], bucket_delete, cutoff(hour_rollup_days)[:ROLLUPS["hour"][1]]),
+        ]
+        conn = self._conn()
+        deleted = {}
+        for table, statement, before in plan:
+            statement = statement.format(table=table)
+            deleted[table] = 0
+            while True:
+                with conn:
+                    count = conn.execute(statement, (before, batch_size)).rowcount
+                deleted[table] += count
+                if count < batch_size:
+                    break
+                time.sleep(pause)
+        return deleted
+
+    def start_retention(self, interval=3600.0, **retention):
+        """Runs prune() every `interval` seconds on a background thread"""
+        def run():
+            while True:
+                try:
+                    self.prune(**retention)
+                except sqlite3.Error as e:
+                    print(f"Error pruning detections: {e}")
+                time.sleep(interval)
+        self._retention_thread = threading.Thread(target=run, daemon=True)
+        self._retention_thread.start()
@@ -0,0 +1,184 @@
+import hashlib
+import io
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+import cv2
+import numpy as np
+
+# Settings that change speed but not the detections/embeddings, so they are not part of the key
+RUNTIME_ONLY_SETTINGS = ('intra_op_threads', 'inter_op_threads', 'ctx_id')
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS embeddings (
+    key TEXT PRIMARY KEY,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    last_used REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_embeddings_last_used ON embeddings (last_used);
+CREATE TABLE IF NOT EXISTS cache_size (
+    id INTEGER PRIMARY KEY CHECK (id = 0),
+    total INTEGER NOT NULL
+);
+"""
+
+def read_image(path):
+    """Returns (image, raw file bytes); the bytes are what the cache is keyed on"""
+    with open(path, 'rb') as f:
+        data = f.read()
+    image = cv2.imdecode(np.frombuffer(data, dtype=np.uint8), cv2.IMREAD_COLOR)
+    return image, data
+
+def model_signature(recognizer):
+    """Identifies everything that affects a recognizer's output: the model pack name,
+    the files actually loaded and the profile settings"""
+    settings = {k: v for k, v in recognizer.settings.items() if k not in RUNTIME_ONLY_SETTINGS}
+    files = []
+    for model in recognizer.model.models.values():
+        stat = os.stat(model.model_file)
+        files.append((os.path.basename(model.model_file), stat.st_size, stat.st_mtime_ns))
+    return json.dumps({'model': recognizer.model_name, 'settings': settings, 'files': sorted(files)},
+                      sort_keys=True, default=list)
+
+def serialize_faces(faces):
+    """Faces that were detected but never embedded are stored without embeddings"""
+    arrays = {
+        'bbox': np.array([f.bbox for f in faces], dtype=np.float32).reshape(-1, 4),
+        'det_score': np.array([f.det_score for f in faces], dtype=np.float32),
+    }
+    if all(f.embedding is not None for f in faces):
+        arrays['embedding'] = (np.array([f.embedding for f in faces], dtype=np.float32).reshape(len(faces), -1)
+                               if faces else np.zeros((0, 0), dtype=np.float32))
+    if faces and all(f.kps is not None for f in faces):
+        arrays['kps'] = np.array([f.kps for f in faces], dtype=np.float32)
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+def deserialize_faces(data):
+    from insightface.app.common import Face
+    arrays = np.load(io.BytesIO(data))
+    kps = arrays['kps'] if 'kps' in arrays.files else None
+    embeddings = arrays['embedding'] if 'embedding' in arrays.files else None
+    return [Face(bbox=arrays['bbox'][i], det_score=arrays['det_score'][i],
+                 kps=kps[i] if kps is not None else None,
+                 embedding=embeddings[i] if embeddings is not None else None)
+            for i in range(len(arrays['bbox']))]
+
+class EmbeddingCache:
+    """On-disk cache of detected faces and embeddings, keyed by the image content hash
+    plus the model signature. Entries beyond `max_bytes` are evicted least recently
+    used first. SQLite in WAL mode, so parallel worker processes can share it. The
+    total size is kept as a running counter in the database itself, updated in the
+    same transaction as each insert and eviction, so every process sees the same
+    total without summing the table."""
+
+    def __init__(self, path='embedding_cache.db', max_bytes=256 * 1024 * 1024):
+        self.path = path
+        self.max_bytes = max_bytes
+        self._local = threading.local()
+        self._signatures = {}
+        self.hits = 0
+        self.misses = 0
+        conn = self._conn()
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(SCHEMA)
+        with conn:
+            # Counted once, when the counter is first created
+            conn.execute("INSERT OR IGNORE INTO cache_size (id, total) "
+                         "SELECT 0, COALESCE(SUM(size), 0) FROM embeddings")
+
+    def _conn(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30.0)
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def key(self, data, recognizer, variant=''):
+        """Cache key for raw image bytes processed by `recognizer`; `variant` separates
+        callers that run the models differently on the same image"""
+        signature = self._signatures.get(id(recognizer))
+        if signature is None:
+            signature = self._signatures[id(recognizer)] = model_signature(recognizer)
+        digest = hashlib.sha256(signature.encode())
+        digest.update(variant.encode())
+        digest.update(hashlib.sha256(data).digest())
+        return digest.hexdigest()
+
+    def get(self, key):
+        """Returns the cached faces or None"""
+        conn = self._conn()
+        row = conn.execute("SELECT data FROM embeddings WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        with conn:
+            conn.execute("UPDATE embeddings SET last_used = ? WHERE key = ?", (time.time(), key))
+        self.hits += 1
+        return deserialize_faces(row[0])
+
+    def put(self, key, faces):
+        data = serialize_faces(faces)
+        conn = self._conn()
+        with conn:
+            # Take the write lock first so the size lookup and the counter update agree
+            conn.execute("BEGIN IMMEDIATE")
+            old = conn.execute("SELECT size FROM embeddings WHERE key = ?", (key,)).fetchone()
+            conn.execute("INSERT OR REPLACE INTO embeddings (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                         (key, data, len(data), time.time()))
+            conn.execute("UPDATE cache_size SET total = total + ? WHERE id = 0",
+                         (len(data) - (old[0] if old else 0),))
+            self._evict(conn)
+
+    def _evict(self, conn):
+        total = conn.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        # Walk from the least recently used entry until enough space is freed
+        excess, evict, freed = total - self.max_bytes, [], 0
+        for key, size in conn.execute("SELECT key, size FROM embeddings ORDER BY last_used"):
+            evict.append((key,))
+            freed += size
+            if freed >= excess:
+                break
+        conn.executemany("DELETE FROM embeddings WHERE key = ?", evict)
+        conn.execute("UPDATE cache_size SET total = total - ? WHERE id = 0", (freed,))
+
+    def faces(self, data, recognizer, compute, variant=''):
+        """Returns cached faces for the image bytes, or runs compute() and caches its result"""
+        key = self.key(data, recognizer, variant)
+        faces = self.get(key)
+        if faces is None:
+            faces = compute()
+            self.put(key, faces)
+        return faces
+
+    def stats(self):
+        conn = self._conn()
+        entries = conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        size = conn.execute("SELECT total FROM cache_size WHERE id = 0").fetchone()[0]
+        return {'entries': entries, 'bytes': size, 'max_bytes': self.max_bytes,
+                'hits': self.hits, 'misses': self.misses}
+
+    def clear(self):
+        conn = self._conn()
+        with conn:
+            conn.execute("DELETE FROM embeddings")
+            conn.execute("UPDATE cache_size SET total = 0 WHERE id = 0")
+        conn.execute("VACUUM")
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] not in ('stats', 'clear'):
+        print("Usage: python embedding_cache.py stats|clear [cache_path]")
+        sys.exit(1)
+    cache = EmbeddingCache(sys.argv[2] if len(sys.argv) > 2 else 'embedding_cache.db')
+    if sys.argv[1] == 'clear':
+        cache.clear()
+    print(cache.stats())
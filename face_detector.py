@@ -1,11 +1,16 @@
-from ultralytics import YOLO
-import cv2
+import numpy as np
 
 class FaceDetector:
     def __init__(self, model_path='model/yolov8s.pt'):
+        # Imported here so importing this module does not pull in ultralytics/torch
+        from ultralytics import YOLO
         self.model = YOLO(model_path)  # Load YOLOv8 face detector
 
     def detect_faces(self, image):
         """Returns list of bounding boxes in format [x1, y1, x2, y2]"""
         results = self.model(image)
-        return results[0].boxes.xyxy.cpu().numpy()  # Convert to numpy array
\ No newline at end of file
+        return results[0].boxes.xyxy.cpu().numpy()  # Convert to numpy array
+
+    def warmup(self):
+        """Runs one inference on a blank image so the first real call is not slow"""
+        self.model(np.zeros((640, 640, 3), dtype=np.uint8), verbose=False)
@@ -1,12 +1,64 @@
-import insightface
+import argparse
+import time
+
 import numpy as np
 import cv2
-from sklearn.metrics.pairwise import cosine_similarity
+
+# Performance profiles. The live pipeline only needs bounding boxes and embeddings, so
+# every profile but "full" skips the landmark and gender/age models.
+PROFILES = {
+    # Original behaviour: every model in the pack
+    "full": {"allowed_modules": None, "det_size": (640, 640), "det_thresh": 0.5},
+    "accurate": {"allowed_modules": ["detection", "recognition"], "det_size": (640, 640),
+                 "det_thresh": 0.5},
+    "balanced": {"allowed_modules": ["detection", "recognition"], "det_size": (480, 480),
+                 "det_thresh": 0.5, "graph_optimization": "all"},
+    "cpu-fast": {"allowed_modules": ["detection", "recognition"], "det_size": (320, 320),
+                 "det_thresh": 0.55, "graph_optimization": "all", "inter_op_threads": 1},
+}
+DEFAULT_PROFILE = "accurate"
 
 class FaceRecognizer:
-    def __init__(self, model_name='buffalo_l'):
-        self.model = insightface.app.FaceAnalysis(name=model_name)
-        self.model.prepare(ctx_id=0)  # Use ctx_id=1 for GPU if available
+    def __init__(self, model_name='buffalo_l', profile=None, **overrides):
+        """`profile` names an entry of PROFILES; keyword overrides replace single settings:
+        allowed_modules, det_size, det_thresh, intra_op_threads, inter_op_threads,
+        graph_optimization ('disabled', 'basic', 'extended', 'all') and ctx_id."""
+        # Imported here so modules that only reference FaceRecognizer start fast
+        import insightface
+        self.model_name = model_name
+        self.profile = profile or DEFAULT_PROFILE
+        self.settings = dict(PROFILES[self.profile], **overrides)
+        self.model = insightface.app.FaceAnalysis(name=model_name,
+                                                  allowed_modules=self.settings.get("allowed_modules"))
+        self._apply_session_options()
+        self.model.prepare(ctx_id=self.settings.get("ctx_id", 0),  # Use ctx_id=1 for GPU if available
+                           det_thresh=self.settings["det_thresh"],
+                           det_size=tuple(self.settings["det_size"]))
+
+    def _apply_session_options(self):
+        """Recreates the ONNX Runtime sessions with the profile's thread counts and graph
+        optimization level (FaceAnalysis has no way to pass SessionOptions through)"""
+        intra = self.settings.get("intra_op_threads")
+        inter = self.settings.get("inter_op_threads")
+        level = self.settings.get("graph_optimization")
+        if intra is None and inter is None and level is None:
+            return
+        import onnxruntime
+        options = onnxruntime.SessionOptions()
+        if intra is not None:
+            options.intra_op_num_threads = intra
+        if inter is not None:
+            options.inter_op_num_threads = inter
+        if level is not None:
+            options.graph_optimization_level = {
+                "disabled": onnxruntime.GraphOptimizationLevel.ORT_DISABLE_ALL,
+                "basic": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_BASIC,
+                "extended": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_EXTENDED,
+                "all": onnxruntime.GraphOptimizationLevel.ORT_ENABLE_ALL,
+            }[level]
+        for model in self.model.models.values():
+            model.session = onnxruntime.InferenceSession(model.model_file, sess_options=options,
+                                                         providers=model.session.get_providers())
     
     def get_embedding(self, face_image):
         """Returns 512-D face embedding with error handling"""
@@ -29,5 +81,73 @@ class FaceRecognizer:
     def compare_faces(self, embedding1, embedding2, threshold=0.6):
         if embedding1 is None or embedding2 is None:
             return False
-        similarity = cosine_similarity([embedding1], [embedding2])[0][0]
-        return similarity > threshold
\ No newline at end of file
+        embedding1 = np.ravel(embedding1)
+        embedding2 = np.ravel(embedding2)
+        similarity = np.dot(embedding1, embedding2) / (np.linalg.norm(embedding1) * np.linalg.norm(embedding2))
+        return similarity > threshold
+
+    def detect(self, image, max_num=0, offset=(0, 0)):
+        """Runs only the face detector; returns faces with bbox and landmarks but no embedding.
+        `offset` shifts the results when `image` is a crop of a larger frame."""
+        from insightface.app.common import Face
+        bboxes, kpss = self.model.det_model.detect(image, max_num=max_num, metric='default')
+        if offset != (0, 0):
+            bboxes[:, 0:4] += np.array([offset[0], offset[1], offset[0], offset[1]], dtype=bboxes.dtype)
+            if kpss is not None:
+                kpss += np.array(offset, dtype=kpss.dtype)
+        return [Face(bbox=bboxes[i, 0:4], kps=kpss[i] if kpss is not None else None,
+                     det_score=bboxes[i, 4])
+                for i in range(bboxes.shape[0])]
+
+    def embed(self, image, faces, scale=None):
+        """Fills in face.embedding using only the recognition model (aligned on face.kps).
+        `scale` (sx, sy) means the faces were detected on a copy of `image` shrunk by that
+        factor: alignment then uses the full-resolution pixels and the faces keep their
+        detection-scale coordinates."""
+        recognition = self.model.models['recognition']
+        if scale is None:
+            for face in faces:
+                recognition.get(image, face)
+            return faces
+        from insightface.app.common import Face
+        sx, sy = scale
+        for face in faces:
+            full = Face(bbox=face.bbox * np.array([sx, sy, sx, sy], dtype=np.float32),
+                        kps=face.kps * np.array([sx, sy], dtype=np.float32))
+            face.embedding = recognition.get(image, full)
+        return faces
+
+    def warmup(self):
+        """Runs the detector and the embedding model once on blank input, so the
+        first real frame does not pay for ONNX Runtime's lazy initialisation"""
+        self.detect(np.zeros((640, 640, 3), dtype=np.uint8))
+        self.model.models['recognition'].get_feat(np.zeros((112, 112, 3), dtype=np.uint8))
+
+def benchmark(profiles, image_path, frames=50):
+    """Prints per-frame detection + embedding latency for each profile on one image"""
+    image = cv2.imread(image_path)
+    if image is None:
+        print(f"Error: Could not read image {image_path}")
+        return
+    print(f"{'profile':>10} {'load s':>7} {'faces':>6} {'avg ms':>8} {'p95 ms':>8} {'fps':>6}")
+    for profile in profiles:
+        start = time.perf_counter()
+        recognizer = FaceRecognizer(profile=profile)
+        recognizer.warmup()
+        load = time.perf_counter() - start
+        timings = []
+        for _ in range(frames):
+            start = time.perf_counter()
+            faces = recognizer.embed(image, recognizer.detect(image))
+            timings.append(time.perf_counter() - start)
+        timings = np.array(timings) * 1000
+        print(f"{profile:>10} {load:>7.2f} {len(faces):>6} {timings.mean():>8.1f} "
+              f"{np.percentile(timings, 95):>8.1f} {1000 / timings.mean():>6.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Frame latency per FaceRecognizer profile")
+    parser.add_argument('--image', default='first.jpg')
+    parser.add_argument('--profiles', default=','.join(PROFILES))
+    parser.add_argument('--frames', type=int, default=50)
+    args = parser.parse_args()
+    benchmark(args.profiles.split(','), args.image, args.frames)
@@ -0,0 +1,61 @@
+import threading
+import time
+
+class FrameBus:
+    """In-process channel holding the latest annotated frame and detection results
+    per camera. Publishers never block; readers wait for a newer sequence number."""
+
+    def __init__(self):
+        self._cond = threading.Condition()
+        self._latest = {}  # camera_id -> (seq, frame, detections, published_at)
+        self._closed = {}  # camera_id -> reason
+
+    def publish(self, camera_id, frame, detections=()):
+        """Stores a copy of `frame` so the publisher can keep reusing its buffer"""
+        frame = frame.copy()
+        with self._cond:
+            seq = self._latest[camera_id][0] + 1 if camera_id in self._latest else 1
+            self._latest[camera_id] = (seq, frame, list(detections), time.time())
+            self._closed.pop(camera_id, None)
+            self._cond.notify_all()
+        return seq
+
+    def open(self, camera_id):
+        """Clears a previous close so a restarted camera can be waited on again"""
+        with self._cond:
+            self._closed.pop(camera_id, None)
+
+    def close(self, camera_id, reason="stopped"):
+        """Marks a camera as ended so waiting readers return"""
+        with self._cond:
+            self._closed[camera_id] = reason
+            self._cond.notify_all()
+
+    def is_closed(self, camera_id):
+        with self._cond:
+            return camera_id in self._closed
+
+    def latest(self, camera_id):
+        """Returns (seq, frame, detections, published_at) or None"""
+        with self._cond:
+            return self._latest.get(camera_id)
+
+    def wait(self, camera_id, after_seq=0, timeout=5.0):
+        """Waits for a frame newer than `after_seq`; returns None on timeout or close"""
+        def ready():
+            entry = self._latest.get(camera_id)
+            return (entry is not None and entry[0] > after_seq) or camera_id in self._closed
+        with self._cond:
+            if not self._cond.wait_for(ready, timeout):
+                return None
+            entry = self._latest.get(camera_id)
+            if entry is None or entry[0] <= after_seq:
+                return None
+            return entry
+
+    def cameras(self):
+        with self._cond:
+            return [camera_id for camera_id in self._latest if camera_id not in self._closed]
+
+# Shared by the analysis threads and the web app
+frame_bus = FrameBus()
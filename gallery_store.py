@@ -0,0 +1,198 @@
+import json
+import os
+import sys
+import time
+from contextlib import contextmanager
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows: no cross-process lock, one enrolling process at a time
+    fcntl = None
+
+class PackedGallery:
+    """Single-file gallery: `gallery.f32` is a raw matrix of normalized float32 rows
+    and `gallery.jsonl` holds one metadata record per row, plus tombstone records
+    (no row, `deleted: true`) for removed identities. Both files are only ever
+    appended to, and the matrix is opened with np.memmap so startup reads no
+    embeddings and every process shares the same page-cache pages."""
+
+    MATRIX_FILE = 'gallery.f32'
+    INDEX_FILE = 'gallery.jsonl'
+    LOCK_FILE = 'gallery.lock'
+
+    def __init__(self, db_folder, dim=512):
+        self.db_folder = db_folder
+        self.dim = dim
+        self.matrix_path = os.path.join(db_folder, self.MATRIX_FILE)
+        self.index_path = os.path.join(db_folder, self.INDEX_FILE)
+        self.lock_path = os.path.join(db_folder, self.LOCK_FILE)
+        # Matrix rows and gallery.jsonl bytes this instance has accounted for, so
+        # appends don't re-read the whole index
+        self._rows = 0
+        self._offset = 0
+
+    @classmethod
+    def exists(cls, db_folder):
+        return os.path.exists(os.path.join(db_folder, cls.INDEX_FILE))
+
+    def read_records(self):
+        """Returns every complete metadata record, skipping a half-written last line"""
+        return self.read_records_since(0)[0]
+
+    def read_records_since(self, offset):
+        """Returns (complete records after byte `offset`, offset just past the last one)"""
+        if not os.path.exists(self.index_path):
+            return [], 0
+        with open(self.index_path, 'rb') as f:
+            f.seek(offset)
+            data = f.read()
+        complete = data[:data.rfind(b'\n') + 1]
+        records = [json.loads(line) for line in complete.decode('utf-8').split('\n') if line]
+        for record in records:
+            if 'dim' in record:
+                self.dim = record['dim']
+                break
+        return records, offset + len(complete)
+
+    @staticmethod
+    def matrix_rows(records):
+        """Number of matrix rows the records describe (tombstones have none)"""
+        return sum(1 for record in records if 'row' in record)
+
+    @staticmethod
+    def fold(records, entries=None):
+        """Applies records in order to a name -> matrix row mapping. A later record for
+        the same name supersedes the earlier one but keeps the identity's position; a
+        tombstone drops it. Passing the previous mapping folds in new records only."""
+        entries = dict(entries or {})
+        for record in records:
+            if record.get('deleted'):
+                entries.pop(record['name'], None)
+            else:
+                entries[record['name']] = record['row']
+        return entries
+
+    def open_matrix(self, rows):
+        """Memory-maps the first `rows` rows of the matrix file read-only"""
+        if rows == 0:
+            return np.zeros((0, self.dim), dtype=np.float32)
+        return np.memmap(self.matrix_path, dtype=np.float32, mode='r', shape=(rows, self.dim))
+
+    def load(self):
+        """Returns (names, matrix) with one row per identity; a later record for the
+        same name supersedes the earlier one but keeps the identity's position"""
+        records = self.read_records()
+        entries = self.fold(records)
+        return list(entries), self.gallery_matrix(list(entries.values()), self.matrix_rows(records))
+
+    def gallery_matrix(self, rows, total_rows):
+        """Gallery matrix for the given file rows; without superseded or removed rows
+        the memmap itself is the gallery (zero-copy)"""
+        matrix = self.open_matrix(total_rows)
+        if rows != list(range(total_rows)):
+            matrix = np.ascontiguousarray(matrix[rows])
+        return matrix
+
+    @contextmanager
+    def _locked(self):
+        """Exclusive lock across processes for the sync-then-write sequence of a writer"""
+        with open(self.lock_path, 'a') as lock:
+            if fcntl is not None:
+                fcntl.flock(lock.fileno(), fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                if fcntl is not None:
+                    fcntl.flock(lock.fileno(), fcntl.LOCK_UN)
+
+    def _repair_tail(self):
+        """Drops a half-written last line left by a writer that died mid-append. Only
+        called under the lock, where no other writer can still be finishing it."""
+        if not os.path.exists(self.index_path):
+            return
+        with open(self.index_path, 'rb+') as f:
+            size = f.seek(0, os.SEEK_END)
+            if size == 0:
+                return
+            f.seek(size - 1)
+            if f.read(1) == b'\n':
+                return
+            f.seek(0)
+            data = f.read()
+            f.truncate(data.rfind(b'\n') + 1)
+
+    def _sync_rows(self):
+        """Catches the row count up with records other processes appended since this
+        instance last read or wrote the index; a rewritten (shrunk) file is rescanned"""
+        size = os.path.getsize(self.index_path) if os.path.exists(self.index_path) else 0
+        if size < self._offset:
+            self._rows, self._offset = 0, 0
+        if size != self._offset:
+            records, self._offset = self.read_records_since(self._offset)
+            self._rows += self.matrix_rows(records)
+
+    def _write_records(self, records):
+        with open(self.index_path, 'a', encoding='utf-8') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+            self._offset = f.tell()
+
+    def append(self, names, vectors):
+        """Appends normalized rows; metadata is written after the matrix bytes so
+        readers never see a record whose row is not on disk yet"""
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32).reshape(len(names), self.dim)
+        with self._locked():
+            self._repair_tail()
+            self._sync_rows()
+            first_row = self._rows
+            with open(self.matrix_path, 'ab') as f:
+                # Bytes past the last recorded row belong to no record (a writer died
+                # between the two files); with the lock held they are safe to drop
+                f.seek(first_row * self.dim * 4)
+                f.truncate()
+                f.write(vectors.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+            added = time.time()
+            self._write_records([{'row': first_row + i, 'name': name, 'dim': self.dim, 'added': added}
+                                 for i, name in enumerate(names)])
+            self._rows += len(names)
+
+    def remove(self, names):
+        """Appends tombstones; the rows stay in the matrix file but drop out of the gallery"""
+        with self._locked():
+            self._repair_tail()
+            self._sync_rows()
+            removed = time.time()
+            self._write_records([{'name': name, 'deleted': True, 'added': removed} for name in names])
+
+def migrate_npy_folder(db_folder='face_db'):
+    """One-shot conversion of a per-person .npy folder into the packed format.
+    The .npy files are left in place; FaceDatabase ignores them once packed."""
+    from database_manager import normalize_embeddings
+
+    store = PackedGallery(db_folder)
+    if PackedGallery.exists(db_folder):
+        print(f"{db_folder} is already packed")
+        return 0
+    files = sorted(f for f in os.listdir(db_folder) if f.endswith('.npy'))
+    if not files:
+        print(f"No .npy files found in {db_folder}")
+        return 0
+    names = [os.path.splitext(f)[0] for f in files]
+    vectors = normalize_embeddings(np.stack([np.load(os.path.join(db_folder, f)).ravel()
+                                             for f in files]))
+    store.dim = vectors.shape[1]
+    store.append(names, vectors)
+    print(f"Migrated {len(names)} identities into {store.matrix_path}")
+    return len(names)
+
+if __name__ == "__main__":
+    if len(sys.argv) < 2 or sys.argv[1] != 'migrate':
+        print("Usage: python gallery_store.py migrate [db_folder]")
+        sys.exit(1)
+    migrate_npy_folder(sys.argv[2] if len(sys.argv) > 2 else 'face_db')
@@ -1,54 +1,233 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+
 import cv2
 import numpy as np
-from face_detector import FaceDetector
-from face_recognizer import FaceRecognizer
-from database_manager import FaceDatabase
+from batch_workers import IMAGE_EXTENSIONS, init_worker, load_image, pool_size, worker_state
+from embedding_cache import EmbeddingCache
+from model_registry import GALLERY_QUANTIZE, get_recognizer, get_database
 
-def process_image(image_path: str='sovit_test.jpg', output_path: str = 'sovit_output.jpg') -> None:
+def find_faces(image, recognizer, max_detect_side=2000):
+    """
+    Detect and embed every face in an image.
+    
+    Large images are detected on a downscaled copy (longest side max_detect_side),
+    then aligned and embedded on the original pixels so small faces keep their
+    detail. Boxes and landmarks are in the original image's coordinates.
+    """
+    height, width = image.shape[:2]
+    if max(height, width) <= max_detect_side:
+        # Get face embeddings directly from the recognizer
+        return recognizer.model.get(image)
+
+    ratio = max_detect_side / max(height, width)
+    small = cv2.resize(image, (round(width * ratio), round(height * ratio)), interpolation=cv2.INTER_AREA)
+    faces = recognizer.detect(small)
+    scale = np.array([width / small.shape[1], height / small.shape[0]], dtype=np.float32)
+    for face in faces:
+        face.bbox = face.bbox * np.tile(scale, 2)
+        if face.kps is not None:
+            face.kps = face.kps * scale
+    return recognizer.embed(image, faces)
+
+def analyze_image(image, recognizer, database, faces=None):
+    """
+    Detect and recognize every face in an image.
+    
+    Args:
+        faces (list): Faces from find_faces (e.g. cached); detected here if None
+    
+    Returns:
+        list: One dict per face with 'box', 'name' and 'score'
+    """
+    if faces is None:
+        faces = find_faces(image, recognizer)
+
+    # Match all embedded faces against the gallery in one call
+    matches = iter(database.recognize_faces(
+        [face.embedding for face in faces if face.embedding is not None]))
+
+    results = []
+    for face in faces:
+        name, score = "Unknown", None
+        if face.embedding is not None:
+            name, score = next(matches)
+        results.append({
+            'box': [int(v) for v in face.bbox.astype(int)],
+            'name': name,
+            'score': score,
+        })
+    return results
+
+def annotate_image(image, results):
+    """Draw boxes and names from analyze_image results onto the image"""
+    for result in results:
+        x1, y1, x2, y2 = result['box']
+        if result['score'] is not None:
+            color = (0, 255, 0) if result['name'] != "Unknown" else (0, 0, 255)
+            cv2.putText(image, result['name'], (x1, y1 - 10), 
+                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
+        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
+    return image
+
+def cached_faces(image, data, recognizer, cache):
+    """find_faces through the embedding cache, so unchanged images skip inference"""
+    if cache is None:
+        return find_faces(image, recognizer)
+    return cache.faces(data, recognizer, lambda: find_faces(image, recognizer), variant='image_app:two_scale')
+
+def process_image(image_path: str='sovit_test.jpg', output_path: str = 'sovit_output.jpg',
+                  cache_path: str = 'embedding_cache.db') -> None:
     """
     Process an image to detect and recognize faces.
     
     Args:
         image_path (str): Path to the input image
         output_path (str): Path where the processed image will be saved
+        cache_path (str): Embedding cache database, or None to always run the models
     """
-    detector = FaceDetector()
-    recognizer = FaceRecognizer()
-    database = FaceDatabase()
+    recognizer = get_recognizer()
+    database = get_database()
 
-    image = cv2.imread(image_path)
+    image, data = load_image(image_path)
     if image is None:
         print(f"🚨 Error: Could not read image at {image_path}")
         return
 
-    # Resize large images to avoid memory issues
-    height, width = image.shape[:2]
-    if max(height, width) > 2000:
-        image = cv2.resize(image, (width // 2, height // 2))
-
-    # Get face embeddings directly from the recognizer
-    faces = recognizer.model.get(image)
-    print(f"🔍 Detected {len(faces)} faces")
-
-    for i, face in enumerate(faces):
-        # Get the bounding box
-        bbox = face.bbox.astype(int)
-        x1, y1, x2, y2 = bbox
-        
-        # Get the embedding
-        embedding = face.embedding
-        name = "Unknown"
-        if embedding is not None:
-            name = database.recognize_face(embedding)
-            color = (0, 255, 0) if name != "Unknown" else (0, 0, 255)
-            cv2.putText(image, name, (x1, y1 - 10), 
-                       cv2.FONT_HERSHEY_SIMPLEX, 0.9, color, 2)
-        
-        cv2.rectangle(image, (x1, y1), (x2, y2), (0, 255, 0), 2)
-        print(f"👤 Face {i}: {name}")
+    cache = EmbeddingCache(cache_path) if cache_path else None
+    faces = cached_faces(image, data, recognizer, cache)
+    results = analyze_image(image, recognizer, database, faces)
+    print(f"🔍 Detected {len(results)} faces")
+    for i, result in enumerate(results):
+        print(f"👤 Face {i}: {result['name']}")
 
-    cv2.imwrite(output_path, image)
+    cv2.imwrite(output_path, annotate_image(image, results))
     print(f"💾 Results saved to {output_path}")
 
+def collect_images(inputs):
+    """Expand directories (recursively), glob patterns, @list files and plain paths"""
+    files = []
+    for item in inputs:
+        if item.startswith('@'):
+            with open(item[1:], 'r', encoding='utf-8') as f:
+                files.extend(line.strip() for line in f if line.strip())
+        elif os.path.isdir(item):
+            for root, _, names in os.walk(item):
+                files.extend(os.path.join(root, n) for n in sorted(names)
+                             if n.lower().endswith(IMAGE_EXTENSIONS))
+        elif glob.has_magic(item):
+            files.extend(sorted(glob.glob(item, recursive=True)))
+        else:
+            files.append(item)
+    # Keep the first occurrence of each file
+    return list(dict.fromkeys(files))
+
+def _init_worker(profile, db_folder, annotate_dir, threads, cache_path, quantize=None):
+    """Loads the models and the gallery once per worker process"""
+    from database_manager import FaceDatabase
+    init_worker(profile, threads, cache_path)
+    worker_state['database'] = FaceDatabase(db_folder, quantize=quantize)
+    worker_state['annotate_dir'] = annotate_dir
+
+def _process_file(path):
+    start = time.perf_counter()
+    record = {'file': path}
+    image, data = load_image(path)
+    if image is None:
+        record['error'] = "Could not read image"
+    else:
+        try:
+            recognizer = worker_state['recognizer']
+            faces = cached_faces(image, data, recognizer, worker_state['cache'])
+            results = analyze_image(image, recognizer, worker_state['database'], faces)
+            record['boxes'] = [r['box'] for r in results]
+            record['names'] = [r['name'] for r in results]
+            record['scores'] = [r['score'] for r in results]
+            if worker_state['annotate_dir']:
+                out_path = os.path.join(worker_state['annotate_dir'],
+                                        os.path.splitdrive(os.path.abspath(path))[1].lstrip(os.sep))
+                os.makedirs(os.path.dirname(out_path), exist_ok=True)
+                cv2.imwrite(out_path, annotate_image(image, results))
+                record['annotated'] = out_path
+        except Exception as e:
+            record['error'] = str(e)
+    record['seconds'] = round(time.perf_counter() - start, 4)
+    return record
+
+def completed_files(output_path):
+    """Files already recorded in an existing JSONL output (for resuming)"""
+    done = set()
+    if os.path.exists(output_path):
+        with open(output_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    done.add(json.loads(line)['file'])
+                except (ValueError, KeyError):
+                    continue  # half-written last line from an interrupted run
+    return done
+
+def process_images(inputs, output_path='results.jsonl', workers=None, annotate_dir=None,
+                   profile=None, db_folder='face_db', resume=True, report_every=50,
+                   cache_path='embedding_cache.db', quantize=None):
+    """
+    Process many images across a process pool, streaming one JSONL record per image.
+    
+    Args:
+        inputs (list): Directories, glob patterns, '@file' lists or image paths
+        output_path (str): JSONL file that records are appended to
+        workers (int): Worker processes (default: CPU count)
+        annotate_dir (str): If set, annotated copies are written under this folder
+        resume (bool): Skip files already present in output_path
+        cache_path (str): Embedding cache shared by the workers, or None to disable
+        quantize (str): Match against a 'float16' or 'int8' copy of the gallery
+    """
+    files = collect_images(inputs)
+    done = completed_files(output_path) if resume else set()
+    todo = [f for f in files if f not in done]
+    print(f"📂 {len(files)} images, {len(files) - len(todo)} already done, {len(todo)} to process")
+    if not todo:
+        return 0
+
+    workers, threads = pool_size(workers)
+    start = time.perf_counter()
+    processed = errors = 0
+    with open(output_path, 'a' if resume else 'w', encoding='utf-8') as out, \
+            multiprocessing.Pool(workers, initializer=_init_worker,
+                                 initargs=(profile, db_folder, annotate_dir, threads, cache_path,
+                                           quantize or GALLERY_QUANTIZE)) as pool:
+        for record in pool.imap_unordered(_process_file, todo, chunksize=4):
+            # One flushed line per image, so an interrupted run resumes where it stopped
+            out.write(json.dumps(record) + '\n')
+            out.flush()
+            processed += 1
+            errors += 'error' in record
+            if processed % report_every == 0 or processed == len(todo):
+                elapsed = time.perf_counter() - start
+                print(f"⏱️ {processed}/{len(todo)} images, {processed / elapsed:.1f} images/sec, "
+                      f"{errors} errors")
+    return processed
+
 if __name__ == "__main__":
-    process_image('second.jpg', 'output.jpg')
\ No newline at end of file
+    if len(sys.argv) == 1:
+        process_image('second.jpg', 'output.jpg')
+    else:
+        parser = argparse.ArgumentParser(description="Batch face recognition over archived images")
+        parser.add_argument('inputs', nargs='+', help="directories, globs, @list files or image paths")
+        parser.add_argument('--output', default='results.jsonl')
+        parser.add_argument('--workers', type=int)
+        parser.add_argument('--annotate-dir')
+        parser.add_argument('--profile', help="FaceRecognizer profile, e.g. cpu-fast")
+        parser.add_argument('--db', default='face_db')
+        parser.add_argument('--no-resume', action='store_true')
+        parser.add_argument('--cache', default='embedding_cache.db', help="embedding cache database")
+        parser.add_argument('--no-cache', action='store_true')
+        parser.add_argument('--quantize', choices=('float16', 'int8'), help="compact gallery representation")
+        args = parser.parse_args()
+        process_images(args.inputs, args.output, args.workers, args.annotate_dir,
+                       args.profile, args.db, resume=not args.no_resume,
+                       cache_path=None if args.no_cache else args.cache, quantize=args.quantize)
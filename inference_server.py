@@ -0,0 +1,218 @@
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from metrics import metrics_registry
+
+BATCH_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+class InferenceScheduler:
+    """One inference thread serving every camera with a single set of weights.
+
+    Camera threads submit detection requests and aligned face crops; the scheduler
+    picks work by weighted fair queuing (each camera's virtual time grows by
+    1/weight per request or crop served, lowest virtual time goes next), so busy
+    cameras cannot starve quiet ones and high-weight cameras, e.g. ones watching
+    restricted zones, get proportionally more of the CPU. Face crops from all
+    cameras are embedded together in one batched ArcFace call."""
+
+    def __init__(self, recognizer, max_batch=32, max_wait=0.004, registry=None):
+        self.recognizer = recognizer
+        self.recognition = recognizer.model.models['recognition']
+        # Fixed-batch exports can only take one crop per call
+        batch_dim = self.recognition.session.get_inputs()[0].shape[0]
+        self.max_batch = max_batch if not isinstance(batch_dim, int) else batch_dim
+        self.max_wait = max_wait
+        self.registry = registry or metrics_registry
+        self._cond = threading.Condition()
+        self._pending = {}  # camera_id -> list of (kind, payload, future, submitted_at)
+        self._weights = {}
+        self._virtual = {}
+        self._queue_wait = {}
+        self._thread = None
+        self._running = False
+        self._batch_size = self.registry.histogram("theft_inference_batch_size",
+                                                   "Face crops per batched embedding call", BATCH_BUCKETS)
+        # Counters
+        self.detections = 0
+        self.batches = 0
+        self.crops = 0
+
+    def start(self):
+        self._running = True
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        with self._cond:
+            self._running = False
+            self._cond.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+
+    def register(self, camera_id, weight=1.0):
+        """Adds a camera; a newcomer starts at the current minimum virtual time"""
+        with self._cond:
+            self._weights[camera_id] = max(float(weight), 0.01)
+            self._pending.setdefault(camera_id, [])
+            if camera_id not in self._virtual:
+                self._virtual[camera_id] = min(self._virtual.values(), default=0.0)
+
+    def unregister(self, camera_id):
+        with self._cond:
+            for _, _, future, _ in self._pending.pop(camera_id, []):
+                future.cancel()
+            self._weights.pop(camera_id, None)
+            self._virtual.pop(camera_id, None)
+            self._queue_wait.pop(camera_id, None)
+
+    def client(self, camera_id, weight=1.0):
+        """Recognizer-compatible handle for one camera (detect/embed)"""
+        self.register(camera_id, weight)
+        return SchedulerClient(self, camera_id)
+
+    def submit(self, camera_id, kind, payload):
+        future = Future()
+        with self._cond:
+            if camera_id not in self._pending:
+                raise KeyError(f"Camera {camera_id} is not registered")
+            self._pending[camera_id].append((kind, payload, future, time.monotonic()))
+            self._cond.notify_all()
+        return future
+
+    def _next_camera(self, kind=None):
+        """Camera with the lowest virtual time that has pending work (of `kind`)"""
+        best = None
+        for camera_id, requests in self._pending.items():
+            if requests and (kind is None or requests[0][0] == kind):
+                if best is None or self._virtual[camera_id] < self._virtual[best]:
+                    best = camera_id
+        return best
+
+    def _take(self, camera_id, cost=1.0):
+        self._virtual[camera_id] += cost / self._weights[camera_id]
+        request = self._pending[camera_id].pop(0)
+        histogram = self._queue_wait.get(camera_id)
+        if histogram is None:
+            histogram = self._queue_wait[camera_id] = self.registry.histogram(
+                "theft_inference_queue_seconds", "Time requests waited for the scheduler", camera=camera_id)
+        histogram.observe(time.monotonic() - request[3])
+        return request
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: not self._running or self._next_camera() is not None)
+                if not self._running:
+                    return
+                camera_id = self._next_camera()
+                kind = self._pending[camera_id][0][0]
+                if kind == "detect":
+                    work = [(camera_id, self._take(camera_id))]
+                else:
+                    # Give other cameras a moment to add their crops to this batch
+                    deadline = time.monotonic() + self.max_wait
+                    while self._pending_crops() < self.max_batch and self._running:
+                        remaining = deadline - time.monotonic()
+                        if remaining <= 0 or not self._cond.wait(remaining):
+                            break
+                    work, crops = [], 0
+                    while crops < self.max_batch:
+                        camera_id = self._next_camera("embed")
+                        if camera_id is None:
+                            break
+                        count = len(self._pending[camera_id][0][1])
+                        work.append((camera_id, self._take(camera_id, count)))
+                        crops += count
+            if kind == "detect":
+                self._run_detect(work[0][1])
+            else:
+                self._run_embed([request for _, request in work])
+
+    def _pending_crops(self):
+        return sum(len(payload) for requests in self._pending.values()
+                   for kind, payload, _, _ in requests if kind == "embed")
+
+    def _run_detect(self, request):
+        _, (image, max_num, offset), future, _ = request
+        if not future.set_running_or_notify_cancel():
+            return
+        try:
+            future.set_result(self.recognizer.detect(image, max_num=max_num, offset=offset))
+        except Exception as e:
+            future.set_exception(e)
+        self.detections += 1
+
+    def _run_embed(self, requests):
+        requests = [r for r in requests if r[2].set_running_or_notify_cancel()]
+        crops = [crop for _, payload, _, _ in requests for crop in payload]
+        if not crops:
+            return
+        try:
+            if self.max_batch == 1:
+                features = np.vstack([self.recognition.get_feat(crop) for crop in crops])
+            else:
+                features = np.vstack([self.recognition.get_feat(crops[i:i + self.max_batch])
+                                      for i in range(0, len(crops), self.max_batch)])
+        except Exception as e:
+            for _, _, future, _ in requests:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        self.crops += len(crops)
+        self._batch_size.observe(len(crops))
+        start = 0
+        for _, payload, future, _ in requests:
+            future.set_result(features[start:start + len(payload)])
+            start += len(payload)
+
+    def stats(self):
+        return {'detections': self.detections, 'batches': self.batches, 'crops': self.crops,
+                'avg_batch': self.crops / max(self.batches, 1)}
+
+class SchedulerClient:
+    """Stands in for FaceRecognizer inside process_webcam: detect() and embed() go
+    through the shared scheduler and block until the result is back"""
+
+    def __init__(self, scheduler, camera_id):
+        self.scheduler = scheduler
+        self.camera_id = camera_id
+        self.input_size = scheduler.recognition.input_size[0]
+
+    def detect(self, image, max_num=0, offset=(0, 0)):
+        return self.scheduler.submit(self.camera_id, "detect", (image, max_num, offset)).result()
+
+    def embed(self, image, faces, scale=None):
+        """Aligns the crops on this camera's thread; only the ArcFace call is shared"""
+        from insightface.utils import face_align
+        if not faces:
+            return faces
+        factor = np.array(scale if scale is not None else (1.0, 1.0), dtype=np.float32)
+        crops = [face_align.norm_crop(image, landmark=face.kps * factor, image_size=self.input_size)
+                 for face in faces]
+        features = self.scheduler.submit(self.camera_id, "embed", crops).result()
+        for face, feature in zip(faces, features):
+            face.embedding = feature.flatten()
+        return faces
+
+    def close(self):
+        self.scheduler.unregister(self.camera_id)
+
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def get_scheduler(profile=None):
+    """Process-wide scheduler on the shared recognizer for a profile"""
+    from model_registry import get_recognizer
+    scheduler = _schedulers.get(profile)
+    if scheduler is not None:
+        return scheduler
+    # Load outside our lock; the registry already makes concurrent callers share one load
+    recognizer = get_recognizer(profile=profile)
+    with _schedulers_lock:
+        if profile not in _schedulers:
+            _schedulers[profile] = InferenceScheduler(recognizer).start()
+        return _schedulers[profile]
@@ -0,0 +1,165 @@
+import bisect
+import threading
+import time
+
+# Latency buckets in seconds, from sub-millisecond stages up to a stalled frame
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+FACES_BUCKETS = (0, 1, 2, 3, 5, 8, 13, 21, 34)
+
+class Counter:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._value
+
+class Gauge:
+    def __init__(self):
+        self._value = 0
+        self._lock = threading.Lock()
+
+    def set(self, value):
+        with self._lock:
+            self._value = value
+
+    def inc(self, amount=1):
+        with self._lock:
+            self._value += amount
+
+    def dec(self, amount=1):
+        with self._lock:
+            self._value -= amount
+
+    @property
+    def value(self):
+        with self._lock:
+            return self._value
+
+class Histogram:
+    """Fixed-bucket histogram; observe() is a bisect and two additions"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self._lock = threading.Lock()
+
+    def observe(self, value):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[i] += 1
+            self.sum += value
+
+    def snapshot(self):
+        """Returns (cumulative counts per bucket incl. +Inf, sum)"""
+        with self._lock:
+            counts, total = list(self.counts), self.sum
+        cumulative, running = [], 0
+        for count in counts:
+            running += count
+            cumulative.append(running)
+        return cumulative, total
+
+def format_labels(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items:
+        return ""
+    escape = lambda v: str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return "{" + ",".join(f'{key}="{escape(value)}"' for key, value in items) + "}"
+
+def format_value(value):
+    if value == float('inf'):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(int(value))
+
+class MetricsRegistry:
+    """Process-wide metrics rendered in the Prometheus text format. Metrics are
+    created once and then updated under their own small lock, so the hot path
+    never takes the registry lock; callback metrics read existing counters
+    (capture, tracker, logger) only when /metrics is scraped."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._families = {}  # name -> (type, help)
+        self._metrics = {}  # name -> {sorted label items: metric or callable}
+
+    def _get(self, kind, name, help, labels, create):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._families.setdefault(name, (kind, help))
+            series = self._metrics.setdefault(name, {})
+            if key not in series:
+                series[key] = create()
+            return series[key]
+
+    def counter(self, name, help, **labels):
+        return self._get("counter", name, help, labels, Counter)
+
+    def gauge(self, name, help, **labels):
+        return self._get("gauge", name, help, labels, Gauge)
+
+    def histogram(self, name, help, buckets=LATENCY_BUCKETS, **labels):
+        return self._get("histogram", name, help, labels, lambda: Histogram(buckets))
+
+    def callback(self, name, kind, help, fn, **labels):
+        """Registers (or replaces) a counter/gauge whose value is fn() at scrape time"""
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._families.setdefault(name, (kind, help))
+            self._metrics.setdefault(name, {})[key] = fn
+
+    def render(self):
+        with self._lock:
+            families = dict(self._families)
+            metrics = {name: dict(series) for name, series in self._metrics.items()}
+        lines = []
+        for name, (kind, help) in sorted(families.items()):
+            lines.append(f"# HELP {name} {help}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, metric in sorted(metrics[name].items()):
+                if isinstance(metric, Histogram):
+                    cumulative, total = metric.snapshot()
+                    for bound, count in zip(metric.buckets + (float('inf'),), cumulative):
+                        lines.append(f"{name}_bucket{format_labels(labels, [('le', format_value(bound))])} {count}")
+                    lines.append(f"{name}_sum{format_labels(labels)} {format_value(total)}")
+                    lines.append(f"{name}_count{format_labels(labels)} {cumulative[-1]}")
+                    continue
+                try:
+                    value = metric() if callable(metric) else metric.value
+                except Exception:
+                    continue  # a source that went away is left out of this scrape
+                lines.append(f"{name}{format_labels(labels)} {format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+class StageTimer:
+    """Times consecutive stages of a loop: each lap(stage) records the time since
+    the previous lap into that stage's latency histogram"""
+
+    def __init__(self, registry, camera_id, name="theft_stage_latency_seconds"):
+        self.registry = registry
+        self.camera_id = camera_id
+        self.name = name
+        self._histograms = {}
+        self._last = time.perf_counter()
+
+    def start(self):
+        self._last = time.perf_counter()
+
+    def lap(self, stage):
+        now = time.perf_counter()
+        histogram = self._histograms.get(stage)
+        if histogram is None:
+            histogram = self._histograms[stage] = self.registry.histogram(
+                self.name, "Time spent in each pipeline stage", camera=self.camera_id, stage=stage)
+        histogram.observe(now - self._last)
+        self._last = now
+
+# Shared by the analysis threads, the broadcaster and the web app
+metrics_registry = MetricsRegistry()
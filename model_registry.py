@@ -0,0 +1,96 @@
+import os
+import threading
+import time
+
+# Process-wide model instances, loaded lazily on first use and shared by every
+# stream, request and script in the process.
+_models = {}
+_locks = {}
+_registry_lock = threading.Lock()
+
+# Gallery representation used when callers don't pick one: unset (float32),
+# 'float16' or 'int8'; e.g. GALLERY_QUANTIZE=int8 python app.py on small edge boxes
+GALLERY_QUANTIZE = os.environ.get('GALLERY_QUANTIZE') or None
+
+# Startup timeline, in seconds since this module was imported
+_started = time.perf_counter()
+_events = []
+
+def mark(event):
+    """Records an event on the startup timeline (only its first occurrence)"""
+    with _registry_lock:
+        if all(name != event for name, _, _ in _events):
+            _events.append((event, time.perf_counter() - _started, None))
+
+def _record(event, start):
+    now = time.perf_counter()
+    with _registry_lock:
+        _events.append((event, now - _started, now - start))
+
+def _get(key, load):
+    model = _models.get(key)
+    if model is not None:
+        return model
+    with _registry_lock:
+        lock = _locks.setdefault(key, threading.Lock())
+    # Per-model lock: concurrent first users wait for one load instead of each loading
+    with lock:
+        if key not in _models:
+            name = ":".join(str(part) for part in key)
+            start = time.perf_counter()
+            model = load()
+            _record(f"load {name}", start)
+            if hasattr(model, 'warmup'):
+                start = time.perf_counter()
+                model.warmup()
+                _record(f"warmup {name}", start)
+            _models[key] = model
+    return _models[key]
+
+def get_recognizer(model_name='buffalo_l', profile=None):
+    """Shared InsightFace recognizer (detection + embedding) for a performance profile"""
+    from face_recognizer import DEFAULT_PROFILE, FaceRecognizer
+    profile = profile or DEFAULT_PROFILE
+    return _get(('recognizer', model_name, profile), lambda: FaceRecognizer(model_name, profile=profile))
+
+def get_detector(model_path='model/yolov8s.pt'):
+    """Shared YOLO detector; only loaded by callers that actually need it"""
+    def load():
+        from face_detector import FaceDetector
+        return FaceDetector(model_path)
+    return _get(('detector', model_path), load)
+
+def get_database(db_folder='face_db', watch_interval=2.0, quantize=None):
+    """Shared face gallery; reloads itself when another process enrolls or removes
+    someone (every `watch_interval` seconds, None to disable). `quantize` ('float16'
+    or 'int8', default GALLERY_QUANTIZE) matches against a compact copy of the gallery."""
+    quantize = quantize or GALLERY_QUANTIZE
+    def load():
+        from database_manager import FaceDatabase
+        database = FaceDatabase(db_folder, quantize=quantize)
+        if watch_interval:
+            database.watch(watch_interval)
+        return database
+    key = ('database', db_folder) if quantize is None else ('database', db_folder, quantize)
+    return _get(key, load)
+
+def preload():
+    """Loads and warms the models the live pipeline needs, then prints the report"""
+    get_recognizer()
+    get_database()
+    mark("models ready")
+    startup_report()
+
+def startup_events():
+    """(event, seconds since import, duration or None) for everything marked so far"""
+    with _registry_lock:
+        return list(_events)
+
+def startup_report():
+    """Prints when each model finished loading/warming up and how long it took"""
+    events = startup_events()
+    print("Startup timeline:")
+    for event, at, took in events:
+        duration = f" ({took:.2f}s)" if took is not None else ""
+        print(f"  {at:8.2f}s  {event}{duration}")
+    return events
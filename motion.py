@@ -0,0 +1,65 @@
+import time
+
+import cv2
+import numpy as np
+
+class MotionGate:
+    """Decides whether a frame is worth running the face models on, by differencing
+    a small blurred grayscale copy against the previous one. Motion inside veil
+    zones is ignored; a keep-alive interval still lets stationary people be rechecked."""
+
+    def __init__(self, width=160, pixel_threshold=25, min_motion=0.002, keepalive_interval=1.0):
+        self.width = width
+        self.pixel_threshold = pixel_threshold
+        self.min_motion = min_motion  # fraction of watched pixels that must change
+        self.keepalive_interval = keepalive_interval
+        self._previous = None
+        self._last_processed = None
+        self._veil_source = None
+        self._watched = None
+        # Counters
+        self.frames = 0
+        self.gated = 0
+
+    def _small_gray(self, frame):
+        height, width = frame.shape[:2]
+        size = (self.width, max(1, round(height * self.width / width)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(gray, (5, 5), 0)
+
+    def _watch_mask(self, veil_mask, shape):
+        """Downscaled mask of the pixels motion is measured on (everything but veil zones);
+        recomputed only when a different veil mask is passed in"""
+        if veil_mask is None:
+            return np.ones(shape, dtype=bool)
+        if veil_mask is not self._veil_source or self._watched.shape != shape:
+            small = cv2.resize(veil_mask.astype(np.uint8), (shape[1], shape[0]),
+                               interpolation=cv2.INTER_NEAREST)
+            self._veil_source, self._watched = veil_mask, small == 0
+        return self._watched
+
+    def should_process(self, frame, veil_mask=None, now=None):
+        """True when the frame has motion outside veil zones or the keep-alive expired"""
+        now = time.monotonic() if now is None else now
+        gray = self._small_gray(frame)
+        previous, self._previous = self._previous, gray
+        self.frames += 1
+
+        moving = True
+        if previous is not None and previous.shape == gray.shape:
+            diff = cv2.absdiff(gray, previous)
+            changed = diff > self.pixel_threshold
+            watched = self._watch_mask(veil_mask, gray.shape)
+            moving = np.count_nonzero(changed & watched) >= self.min_motion * max(np.count_nonzero(watched), 1)
+        keepalive = (self._last_processed is None
+                     or now - self._last_processed >= self.keepalive_interval)
+        if moving or keepalive:
+            self._last_processed = now
+            return True
+        self.gated += 1
+        return False
+
+    @property
+    def gated_fraction(self):
+        return self.gated / max(self.frames, 1)
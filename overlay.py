@@ -0,0 +1,32 @@
+import numpy as np
+
+class OverlayLayer:
+    """A static drawing (shapes, blends, text) captured once as a per-pixel alpha and
+    premultiplied color, then composited onto frames without any per-frame allocation.
+
+    `draw(canvas)` must only depend on the canvas through per-pixel blends, which holds
+    for cv2 drawing plus addWeighted. Rendering it on a black and a white canvas is then
+    enough to recover both the color it adds and how much of the frame it keeps."""
+
+    def __init__(self, draw, size):
+        width, height = size
+        self.size = size
+        black = np.zeros((height, width, 3), dtype=np.uint8)
+        white = np.full((height, width, 3), 255, dtype=np.uint8)
+        draw(black)
+        draw(white)
+        # white = 255 * (1 - alpha) + color * alpha and black = color * alpha
+        alpha = (255 - white.astype(np.int32) + black) * 256 // 255
+        # Never let the added color exceed what alpha allows, so uint16 sums cannot overflow
+        alpha = np.maximum(alpha, (black.astype(np.int32) * 256 + 254) // 255)
+        self.inverse_alpha = (256 - np.clip(alpha, 0, 256)).astype(np.uint16)
+        self.premultiplied = black.astype(np.uint16) << 8
+        self._scratch = np.empty((height, width, 3), dtype=np.uint16)
+
+    def composite(self, frame, out):
+        """Writes frame blended under the layer into `out` (may be `frame` itself)"""
+        np.multiply(frame, self.inverse_alpha, out=self._scratch)
+        np.add(self._scratch, self.premultiplied, out=self._scratch)
+        np.right_shift(self._scratch, 8, out=self._scratch)
+        np.copyto(out, self._scratch, casting='unsafe')
+        return out
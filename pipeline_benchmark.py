@@ -0,0 +1,240 @@
+import argparse
+import itertools
+import json
+import platform
+import tempfile
+import time
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+import webcam_app
+from database_manager import EMBEDDING_DIM, FaceDatabase, normalize_embeddings
+from webcam_app import FRAME_SIZE, draw_zones, get_face_centers, get_zone_layer, get_zone_map
+
+STAGES = ["decode", "resize", "draw_zones", "overlay", "detect_embed", "match", "zones", "encode"]
+
+class StubFace:
+    """Stand-in for insightface's Face with the attributes the pipeline reads"""
+
+    def __init__(self, bbox, kps, det_score):
+        self.bbox = bbox
+        self.kps = kps
+        self.det_score = det_score
+        self.embedding = None
+
+class StubRecognizer:
+    """Deterministic replacement for FaceRecognizer, so the benchmark runs without
+    insightface or model weights. Faces sit on a fixed grid and embed to a known
+    gallery identity plus noise; detect_ms/embed_ms optionally simulate model time."""
+
+    model_name = "stub"
+    profile = "stub"
+    settings = {}
+
+    def __init__(self, faces_per_frame, gallery, seed=0, detect_ms=0.0, embed_ms=0.0):
+        self.faces_per_frame = faces_per_frame
+        self.gallery = gallery
+        self.rng = np.random.default_rng(seed)
+        self.detect_ms = detect_ms
+        self.embed_ms = embed_ms
+        self.model = self  # so model.get() works like FaceAnalysis
+
+    def detect(self, image, max_num=0, offset=(0, 0)):
+        height, width = image.shape[:2]
+        columns = int(np.ceil(np.sqrt(self.faces_per_frame)))
+        rows = int(np.ceil(self.faces_per_frame / columns)) if self.faces_per_frame else 0
+        cell_w, cell_h = width / max(columns, 1), height / max(rows, 1)
+        size = min(cell_w, cell_h) * 0.6
+        faces = []
+        for i in range(self.faces_per_frame):
+            cx = (i % columns + 0.5) * cell_w + offset[0]
+            cy = (i // columns + 0.5) * cell_h + offset[1]
+            bbox = np.array([cx - size / 2, cy - size / 2, cx + size / 2, cy + size / 2], dtype=np.float32)
+            kps = np.array([[cx - size / 5, cy - size / 8], [cx + size / 5, cy - size / 8], [cx, cy],
+                            [cx - size / 6, cy + size / 5], [cx + size / 6, cy + size / 5]], dtype=np.float32)
+            faces.append(StubFace(bbox, kps, 0.9))
+        if self.detect_ms:
+            time.sleep(self.detect_ms / 1000)
+        return faces[:max_num] if max_num else faces
+
+    def embed(self, image, faces, scale=None):
+        for face in faces:
+            identity = self.gallery[self.rng.integers(len(self.gallery))] if len(self.gallery) else 0
+            noise = self.rng.normal(scale=0.02, size=EMBEDDING_DIM)
+            face.embedding = (identity + noise).astype(np.float32)
+        if self.embed_ms:
+            time.sleep(self.embed_ms / 1000 * len(faces))
+        return faces
+
+    def get(self, image):
+        return self.embed(image, self.detect(image))
+
+    def warmup(self):
+        pass
+
+def make_zones(count, size=FRAME_SIZE):
+    """`count` rectangles tiling the frame, cycling through general, restricted and veil"""
+    zone_types = ["general", "restricted", "veil"]
+    zones = {zone_type: [] for zone_type in zone_types}
+    columns = int(np.ceil(np.sqrt(count)))
+    rows = int(np.ceil(count / columns)) if count else 0
+    width, height = size[0] // max(columns, 1), size[1] // max(rows, 1)
+    for i in range(count):
+        x, y = (i % columns) * width, (i // columns) * height
+        zones[zone_types[i % 3]].append(
+            np.array([[x, y], [x + width, y], [x + width, y + height], [x, y + height]], dtype=np.int32))
+    return zones
+
+def synthetic_frames(resolution, count=8, seed=0):
+    """JPEG-encoded frames with gradients and shapes, so decode and encode costs are realistic"""
+    rng = np.random.default_rng(seed)
+    width, height = resolution
+    frames = []
+    x, y = np.meshgrid(np.linspace(0, 255, width), np.linspace(0, 255, height))
+    for i in range(count):
+        image = np.dstack([(x + y * 0.5 + i * 8) % 256, (y + i * 16) % 256, 255 - x]).astype(np.uint8)
+        for _ in range(20):
+            center = (int(rng.integers(width)), int(rng.integers(height)))
+            cv2.circle(image, center, int(rng.integers(10, max(11, height // 6))),
+                       tuple(int(c) for c in rng.integers(0, 255, 3)), -1)
+        image += rng.integers(0, 8, image.shape, dtype=np.uint8)
+        frames.append(cv2.imencode('.jpg', image)[1].tobytes())
+    return frames
+
+def recorded_frames(video_path, resolution, count=32):
+    """The first `count` frames of a recording at the benchmark resolution, JPEG-encoded"""
+    cap = cv2.VideoCapture(video_path)
+    frames = []
+    while len(frames) < count:
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frames.append(cv2.imencode('.jpg', cv2.resize(frame, resolution))[1].tobytes())
+    cap.release()
+    if not frames:
+        raise ValueError(f"Could not read frames from {video_path}")
+    return frames
+
+def summarize(samples):
+    timings = np.array(samples) * 1000
+    return {"mean_ms": round(float(timings.mean()), 4),
+            "p50_ms": round(float(np.percentile(timings, 50)), 4),
+            "p95_ms": round(float(np.percentile(timings, 95)), 4),
+            "max_ms": round(float(timings.max()), 4)}
+
+def run_case(gallery_size, faces_per_frame, zone_count, resolution, frames=100, video=None,
+             detect_ms=0.0, embed_ms=0.0, seed=0):
+    """Times every pipeline stage over `frames` frames for one parameter combination"""
+    rng = np.random.default_rng(seed)
+    gallery = normalize_embeddings(rng.normal(size=(gallery_size, EMBEDDING_DIM)))
+    with tempfile.TemporaryDirectory() as db_folder:
+        database = FaceDatabase(db_folder)
+        database.add_faces([f"person_{i}" for i in range(gallery_size)], gallery)
+        recognizer = StubRecognizer(faces_per_frame, gallery, seed, detect_ms, embed_ms)
+
+        with webcam_app.zone_lock:
+            webcam_app.current_zones = make_zones(zone_count)
+            webcam_app.mark_zones_changed()
+        encoded = recorded_frames(video, resolution) if video else synthetic_frames(resolution, seed=seed)
+
+        frame = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+        vis_frame = np.empty_like(frame)
+        timings = {stage: [] for stage in STAGES + ["total"]}
+        recognized = 0
+        for i in range(frames):
+            marks = [time.perf_counter()]
+            raw_frame = cv2.imdecode(np.frombuffer(encoded[i % len(encoded)], dtype=np.uint8),
+                                     cv2.IMREAD_COLOR)
+            marks.append(time.perf_counter())
+            cv2.resize(raw_frame, FRAME_SIZE, dst=frame)
+            marks.append(time.perf_counter())
+            # Uncached per-frame drawing, for comparison with the cached layer below
+            draw_zones(frame.copy())
+            marks.append(time.perf_counter())
+            get_zone_layer(FRAME_SIZE).composite(frame, out=vis_frame)
+            marks.append(time.perf_counter())
+            faces = recognizer.embed(frame, recognizer.detect(frame))
+            marks.append(time.perf_counter())
+            matches = database.recognize_faces([face.embedding for face in faces])
+            marks.append(time.perf_counter())
+            recognized += sum(name != "Unknown" for name, _ in matches)
+            zone_map = get_zone_map(FRAME_SIZE)
+            centers = get_face_centers(faces)
+            zone_map.in_zone(centers, "veil")
+            zone_map.in_zone(centers, "restricted")
+            marks.append(time.perf_counter())
+            cv2.imencode('.jpg', vis_frame, [cv2.IMWRITE_JPEG_QUALITY, 80])
+            marks.append(time.perf_counter())
+
+            for stage, start, end in zip(STAGES, marks, marks[1:]):
+                timings[stage].append(end - start)
+            # draw_zones is not part of the live loop any more, so it is left out of the total
+            timings["total"].append(marks[-1] - marks[0] - timings["draw_zones"][-1])
+
+    stages = {stage: summarize(samples) for stage, samples in timings.items()}
+    return {
+        "gallery_size": gallery_size,
+        "faces_per_frame": faces_per_frame,
+        "zone_count": zone_count,
+        "resolution": f"{resolution[0]}x{resolution[1]}",
+        "frames": frames,
+        "recognized_fraction": round(recognized / max(frames * faces_per_frame, 1), 4),
+        "fps": round(1000 / stages["total"]["mean_ms"], 2),
+        "stages": stages,
+    }
+
+def run_suite(gallery_sizes, faces, zone_counts, resolutions, frames=100, video=None,
+              detect_ms=0.0, embed_ms=0.0, output_path='pipeline_benchmark.json'):
+    """Runs every parameter combination and writes the results as JSON"""
+    original_zones = webcam_app.current_zones
+    results = []
+    try:
+        for gallery_size, face_count, zone_count, resolution in itertools.product(
+                gallery_sizes, faces, zone_counts, resolutions):
+            result = run_case(gallery_size, face_count, zone_count, resolution, frames, video,
+                              detect_ms, embed_ms)
+            results.append(result)
+            stage_text = " ".join(f"{stage}={result['stages'][stage]['mean_ms']:.2f}" for stage in STAGES)
+            print(f"gallery={gallery_size} faces={face_count} zones={zone_count} "
+                  f"res={result['resolution']}: {result['fps']} fps | {stage_text} (ms)")
+    finally:
+        with webcam_app.zone_lock:
+            webcam_app.current_zones = original_zones
+            webcam_app.mark_zones_changed()
+
+    report = {
+        "created": datetime.now().isoformat(timespec='seconds'),
+        "environment": {"python": platform.python_version(), "numpy": np.__version__,
+                        "opencv": cv2.__version__, "machine": platform.machine(),
+                        "processor": platform.processor(), "frame_size": list(FRAME_SIZE)},
+        "backend": {"recognizer": "stub", "detect_ms": detect_ms, "embed_ms": embed_ms,
+                    "video": video},
+        "results": results,
+    }
+    with open(output_path, 'w', encoding='utf-8') as f:
+        json.dump(report, f, indent=2)
+    print(f"Results saved to {output_path}")
+    return report
+
+def parse_ints(text):
+    return [int(v) for v in text.split(',')]
+
+def parse_resolutions(text):
+    return [tuple(int(v) for v in item.split('x')) for item in text.split(',')]
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Per-stage timing of the webcam pipeline with a stub model")
+    parser.add_argument('--gallery-sizes', type=parse_ints, default=[100, 10000])
+    parser.add_argument('--faces', type=parse_ints, default=[1, 10])
+    parser.add_argument('--zones', type=parse_ints, default=[2, 16])
+    parser.add_argument('--resolutions', type=parse_resolutions, default=[(1280, 720), (1920, 1080)])
+    parser.add_argument('--frames', type=int, default=100)
+    parser.add_argument('--video', help="recorded video to take frames from instead of synthetic ones")
+    parser.add_argument('--detect-ms', type=float, default=0.0, help="simulated detector time per frame")
+    parser.add_argument('--embed-ms', type=float, default=0.0, help="simulated embedding time per face")
+    parser.add_argument('--output', default='pipeline_benchmark.json')
+    args = parser.parse_args()
+    run_suite(args.gallery_sizes, args.faces, args.zones, args.resolutions, args.frames, args.video,
+              args.detect_ms, args.embed_ms, args.output)
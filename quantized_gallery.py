@@ -0,0 +1,209 @@
+import argparse
+import time
+
+import numpy as np
+
+QUANTIZATIONS = ('float16', 'int8')
+
+class QuantizedGallery:
+    """Compact copy of a normalized gallery matrix for matching in RAM.
+
+    float16 halves the memory; int8 stores each row as signed codes with one float32
+    scale per row (row ~= codes * scale), a quarter of the memory. Scores are
+    computed block by block straight from the compact rows, widening only one block
+    at a time, so the float32 gallery never has to be resident. With `rerank` the
+    top-k candidates per query are re-scored exactly against the float32 rows
+    (e.g. the packed store's memmap, which then only pages in those rows)."""
+
+    def __init__(self, matrix, kind='int8', block_rows=4096):
+        if kind not in QUANTIZATIONS:
+            raise ValueError(f"Unknown quantization {kind!r}, expected one of {QUANTIZATIONS}")
+        self.kind = kind
+        self.block_rows = block_rows
+        rows, dim = matrix.shape
+        self.shape = (rows, dim)
+        if kind == 'float16':
+            self.codes = np.empty((rows, dim), dtype=np.float16)
+            self.scales = None
+        else:
+            self.codes = np.empty((rows, dim), dtype=np.int8)
+            self.scales = np.empty(rows, dtype=np.float32)
+        # Quantize in blocks so a memory-mapped source is streamed, not copied whole
+        for start in range(0, rows, block_rows):
+            block = np.asarray(matrix[start:start + block_rows], dtype=np.float32)
+            if kind == 'float16':
+                self.codes[start:start + len(block)] = block
+            else:
+                scales = np.abs(block).max(axis=1) / 127
+                scales[scales == 0] = 1.0
+                self.codes[start:start + len(block)] = np.rint(block / scales[:, None])
+                self.scales[start:start + len(block)] = scales
+
+    def __len__(self):
+        return self.shape[0]
+
+    @property
+    def nbytes(self):
+        return self.codes.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    @property
+    def bytes_per_identity(self):
+        return self.nbytes / max(len(self), 1)
+
+    def __getitem__(self, rows):
+        """Dequantized float32 rows, so IVFIndex.search can score candidates from this"""
+        vectors = self.codes[rows].astype(np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[rows][..., None]
+        return vectors
+
+    def scores(self, queries):
+        """Approximate cosine scores of every query against every row"""
+        queries = np.ascontiguousarray(queries, dtype=np.float32)
+        out = np.empty((len(queries), len(self)), dtype=np.float32)
+        # One float32 block buffer reused for every block instead of a fresh astype()
+        scratch = np.empty((min(self.block_rows, len(self)), self.shape[1]), dtype=np.float32)
+        for start in range(0, len(self), self.block_rows):
+            block = self.codes[start:start + self.block_rows]
+            widened = scratch[:len(block)]
+            np.copyto(widened, block)
+            scores = out[:, start:start + len(block)]
+            np.matmul(queries, widened.T, out=scores)
+            if self.scales is not None:
+                scores *= self.scales[start:start + len(block)]
+        return out
+
+    def search(self, queries, rerank=0, full=None):
+        """Returns the best row and score for each query. With rerank > 0 and the
+        float32 matrix as `full`, the top `rerank` candidates are re-scored exactly."""
+        scores = self.scores(queries)
+        if not rerank or full is None:
+            best = scores.argmax(axis=1)
+            return best, scores[np.arange(len(best)), best]
+        k = min(rerank, len(self))
+        candidates = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        queries = np.asarray(queries, dtype=np.float32)
+        rows = np.empty(len(queries), dtype=np.int64)
+        best_scores = np.empty(len(queries), dtype=np.float32)
+        for i, (query, cells) in enumerate(zip(queries, candidates)):
+            cells = np.sort(cells)  # ascending rows read a memmap sequentially
+            exact = np.asarray(full[cells], dtype=np.float32) @ query
+            best = exact.argmax()
+            rows[i], best_scores[i] = cells[best], exact[best]
+        return rows, best_scores
+
+def parity_report(matrix, queries, kinds=QUANTIZATIONS, reranks=(0, 10), threshold=0.6, margin=0.02,
+                  repeats=3):
+    """Prints memory per identity, match throughput and agreement with the float32
+    scan for each quantization. Agreement counts a query as matching when it gets
+    the same identity, or is Unknown in both, at `threshold`; it is also reported
+    for just the queries whose float32 score is within `margin` of the threshold,
+    where quantization error actually flips decisions. Returns the rows."""
+    def timed(search):
+        best = float('inf')
+        for _ in range(repeats):
+            start = time.perf_counter()
+            result = search()
+            best = min(best, time.perf_counter() - start)
+        return result, len(queries) / best
+
+    def decisions(rows, scores):
+        return np.where(scores > threshold, rows, -1)
+
+    exact_scores, exact_qps = timed(lambda: queries @ matrix.T)
+    exact_rows = exact_scores.argmax(axis=1)
+    exact_best = exact_scores[np.arange(len(queries)), exact_rows]
+    baseline = decisions(exact_rows, exact_best)
+    near = np.abs(exact_best - threshold) <= margin
+    results = [{'kind': 'float32', 'rerank': 0, 'bytes_per_identity': matrix.shape[1] * 4,
+                'queries_per_sec': exact_qps, 'top1_agreement': 1.0, 'decision_agreement': 1.0,
+                'margin_queries': int(near.sum()), 'margin_agreement': 1.0, 'max_score_error': 0.0}]
+    for kind in kinds:
+        start = time.perf_counter()
+        gallery = QuantizedGallery(matrix, kind)
+        built = time.perf_counter() - start
+        for rerank in reranks:
+            (rows, scores), qps = timed(lambda: gallery.search(queries, rerank, matrix))
+            agree = decisions(rows, scores) == baseline
+            results.append({'kind': kind, 'rerank': rerank, 'bytes_per_identity': gallery.bytes_per_identity,
+                            'queries_per_sec': qps, 'top1_agreement': float(np.mean(rows == exact_rows)),
+                            'decision_agreement': float(np.mean(agree)),
+                            'margin_queries': int(near.sum()),
+                            'margin_agreement': float(np.mean(agree[near])) if near.any() else 1.0,
+                            'max_score_error': float(np.abs(scores - exact_best).max()),
+                            'build_seconds': built})
+    print(f"{len(queries)} queries, {int(near.sum())} within {margin} of the {threshold} threshold")
+    print(f"{'gallery':>8} {'rerank':>6} {'B/id':>7} {'queries/s':>10} {'top-1':>7} {'decision':>9} "
+          f"{'margin':>7} {'max err':>8}")
+    for r in results:
+        print(f"{r['kind']:>8} {r['rerank']:>6} {r['bytes_per_identity']:>7.0f} {r['queries_per_sec']:>10.0f} "
+              f"{r['top1_agreement']:>7.4f} {r['decision_agreement']:>9.4f} {r['margin_agreement']:>7.4f} "
+              f"{r['max_score_error']:>8.5f}")
+    return results
+
+def noisy_queries(rows, low, high, rng):
+    """Perturbs normalized rows so each query's cosine to its source row is drawn
+    uniformly from [low, high]"""
+    target = rng.uniform(low, high, len(rows))
+    sigma = np.sqrt((1 / target ** 2 - 1) / rows.shape[1])
+    queries = rows + rng.normal(size=rows.shape) * sigma[:, None]
+    return queries / np.linalg.norm(queries, axis=1, keepdims=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Quantized gallery memory, throughput and float32 parity")
+    parser.add_argument('--db', help="face_db folder to use instead of a synthetic gallery")
+    parser.add_argument('--gallery', type=int, default=50000, help="synthetic gallery size")
+    parser.add_argument('--queries', type=int, default=2000,
+                        help="half enrolled identities scored around the threshold, half impostors")
+    parser.add_argument('--rerank', default='0,10', help="top-k re-ranking depths to compare")
+    parser.add_argument('--threshold', type=float, default=0.6)
+    parser.add_argument('--margin', type=float, default=0.02, help="near-threshold band for margin agreement")
+    parser.add_argument('--min-agreement', type=float, default=0.99,
+                        help="fail if any decision agreement with float32 is below this")
+    parser.add_argument('--min-margin-agreement', type=float, default=0.95,
+                        help="fail if agreement on near-threshold queries is below this")
+    parser.add_argument('--max-error', type=float, default=0.01,
+                        help="fail if any score differs from float32 by more than this")
+    args = parser.parse_args()
+
+    from database_manager import FaceDatabase, normalize_embeddings
+    rng = np.random.default_rng(0)
+    if args.db:
+        database = FaceDatabase(args.db)
+        matrix = np.asarray(database.embeddings)
+        usage = database.memory_usage()
+        print(f"{args.db}: {usage['identities']} identities, {usage['bytes_per_identity']:.0f} B/identity "
+              f"resident as loaded (float32 {usage['float32_bytes']} B, quantized {usage['quantized_bytes']} B)")
+        # Impostors: random directions, scored against the real gallery
+        impostors = normalize_embeddings(rng.normal(size=(args.queries // 2, matrix.shape[1])))
+    else:
+        # Identities drawn around a few hundred centres, like faces sharing demographics;
+        # the extra ones are never enrolled and come back as impostors
+        centres = rng.normal(size=(256, 512))
+        people = args.gallery + args.queries // 2
+        identities = normalize_embeddings(centres[rng.integers(0, 256, people)]
+                                          + rng.normal(size=(people, 512)) * 1.5)
+        matrix, impostors = identities[:args.gallery], identities[args.gallery:]
+        impostors = noisy_queries(impostors, 0.6, 0.9, rng)
+    # Enrolled people seen badly enough that their scores straddle the threshold
+    picks = rng.integers(0, len(matrix), args.queries - len(impostors))
+    genuine = noisy_queries(matrix[picks], args.threshold - 0.15, args.threshold + 0.15, rng)
+    queries = np.vstack([genuine, impostors]).astype(np.float32)
+    results = parity_report(matrix, queries, reranks=[int(k) for k in args.rerank.split(',')],
+                            threshold=args.threshold, margin=args.margin)
+    failures = []
+    for r in results:
+        label = f"{r['kind']} rerank={r['rerank']}"
+        if r['decision_agreement'] < args.min_agreement:
+            failures.append(f"{label}: decision agreement {r['decision_agreement']:.4f} < {args.min_agreement}")
+        if r['margin_agreement'] < args.min_margin_agreement:
+            failures.append(f"{label}: near-threshold agreement {r['margin_agreement']:.4f} "
+                            f"< {args.min_margin_agreement}")
+        if r['max_score_error'] > args.max_error:
+            failures.append(f"{label}: max score error {r['max_score_error']:.5f} > {args.max_error}")
+    if failures:
+        for failure in failures:
+            print(f"❌ {failure}")
+        raise SystemExit(1)
+    worst = min(r['margin_agreement'] for r in results)
+    print(f"✅ All quantized galleries agree with float32, {worst:.2%} on near-threshold queries")
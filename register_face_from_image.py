@@ -1,45 +1,171 @@
-import cv2
-import numpy as np
-from face_detector import FaceDetector
-from face_recognizer import FaceRecognizer
-from database_manager import FaceDatabase
+import argparse
+import multiprocessing
+import os
+import time
 
-def register_face(image_path, name):
+from batch_workers import IMAGE_EXTENSIONS, init_worker, load_image, pool_size, worker_state
+from database_manager import FaceDatabase, normalize_embeddings
+from embedding_cache import EmbeddingCache
+from model_registry import get_recognizer, get_database
+
+def extract_embedding(image, recognizer, data=None, cache=None):
+    """
+    Runs one detection pass and, only when it finds exactly one face, embeds it
+    aligned on its landmarks. With a cache and the image's file bytes, unchanged
+    images skip inference: enrollable faces are cached with their embedding and
+    rejected images with just the faces detected, so they are not detected again.
+    
+    Returns:
+        tuple: (embedding, None) or (None, reason) if the image does not show exactly one face
+    """
+    key = cache.key(data, recognizer, variant='enroll') if cache else None
+    faces = cache.get(key) if cache else None
+    if faces is None:
+        faces = recognizer.detect(image)
+        if len(faces) == 1:
+            # Embed only images that can actually be enrolled
+            faces = recognizer.embed(image, faces)
+        if cache:
+            cache.put(key, faces)
+    if len(faces) != 1:  # Only register if exactly 1 face is detected
+        return None, f"found {len(faces)} faces"
+    if faces[0].embedding is None:
+        return None, "could not extract face features"
+    return faces[0].embedding, None
+
+def build_template(embeddings, outlier_threshold=0.5):
+    """
+    Combines several embeddings of one person into a single template.
+    
+    Embeddings whose cosine similarity to the mean is below `outlier_threshold`
+    (wrong person, bad crop) are dropped and the rest are averaged again.
+    
+    Returns:
+        tuple: (template, number of embeddings kept)
+    """
+    vectors = normalize_embeddings(embeddings)
+    mean = normalize_embeddings(vectors.mean(axis=0))[0]
+    keep = vectors @ mean >= outlier_threshold
+    if len(vectors) > 2 and keep.any():
+        vectors = vectors[keep]
+    return normalize_embeddings(vectors.mean(axis=0))[0], len(vectors)
+
+def register_face(image_path, name, cache_path='embedding_cache.db'):
     # Initialize components
-    detector = FaceDetector()
-    recognizer = FaceRecognizer()
-    database = FaceDatabase()
+    recognizer = get_recognizer()
+    database = get_database()
+    cache = EmbeddingCache(cache_path) if cache_path else None
 
     # Read image
-    image = cv2.imread(image_path)
+    image, data = load_image(image_path)
     if image is None:
         print(f"Error: Could not read image {image_path}")
         return False
 
     print(f"Image loaded successfully. Shape: {image.shape}")
 
-    # Detect faces
-    boxes = detector.detect_faces(image)
-    print(f"Detected {len(boxes)} faces")
-    
-    if len(boxes) != 1:  # Only register if exactly 1 face is detected
-        print(f"Error: Found {len(boxes)} faces. Please use an image with exactly one face.")
+    embedding, error = extract_embedding(image, recognizer, data, cache)
+    if embedding is None:
+        print(f"Error: {error}. Please use an image with exactly one face.")
         return False
 
-    # Do not crop, use the whole image
-    face_img = image
-    print(f"Using the whole image for recognition. Shape: {face_img.shape}")
+    database.add_face(name, embedding)
+    print(f"Successfully registered {name}!")
+    return True
+
+def collect_people(root):
+    """Maps each person_name sub-folder of `root` to its image files"""
+    people = {}
+    for person in sorted(os.listdir(root)):
+        folder = os.path.join(root, person)
+        if not os.path.isdir(folder):
+            continue
+        images = [os.path.join(folder, f) for f in sorted(os.listdir(folder))
+                  if f.lower().endswith(IMAGE_EXTENSIONS)]
+        if images:
+            people[person] = images
+    return people
+
+def _embed_file(task):
+    person, path = task
+    image, data = load_image(path)
+    if image is None:
+        return person, path, None, "could not read image"
+    try:
+        embedding, error = extract_embedding(image, worker_state['recognizer'], data, worker_state['cache'])
+    except Exception as e:
+        return person, path, None, str(e)
+    return person, path, embedding, error
+
+def enroll_directory(root, workers=None, profile=None, db_folder='face_db', min_images=1,
+                     outlier_threshold=0.5, cache_path='embedding_cache.db'):
+    """
+    Enrolls every person in a `root/person_name/*.jpg` tree.
     
-    embedding = recognizer.get_embedding(face_img)
+    Images are embedded in parallel, each person's embeddings are combined into one
+    template, and the gallery is updated once for the whole batch. Embeddings go
+    through the embedding cache, so re-enrolling unchanged images skips inference.
     
-    if embedding is not None:
-        database.add_face(name, embedding)
-        print(f"Successfully registered {name}!")
-        return True
-    else:
-        print("Error: Could not extract face features")
-        return False
+    Returns:
+        list: Names that were enrolled
+    """
+    people = collect_people(root)
+    tasks = [(person, path) for person, images in people.items() for path in images]
+    print(f"📂 {len(people)} people, {len(tasks)} images in {root}")
+    if not tasks:
+        return []
+
+    workers, threads = pool_size(workers)
+    start = time.perf_counter()
+    embeddings = {person: [] for person in people}
+    rejected = 0
+    with multiprocessing.Pool(workers, initializer=init_worker, initargs=(profile, threads, cache_path)) as pool:
+        for person, path, embedding, error in pool.imap_unordered(_embed_file, tasks, chunksize=4):
+            if embedding is None:
+                rejected += 1
+                print(f"⚠️ Skipping {path}: {error}")
+            else:
+                embeddings[person].append(embedding)
+
+    names, templates = [], []
+    for person, vectors in embeddings.items():
+        if len(vectors) < min_images:
+            print(f"❌ {person}: only {len(vectors)} usable images, not enrolled")
+            continue
+        template, kept = build_template(vectors, outlier_threshold)
+        if kept < len(vectors):
+            print(f"⚠️ {person}: dropped {len(vectors) - kept} outlier images")
+        names.append(person)
+        templates.append(template)
+
+    FaceDatabase(db_folder).add_faces(names, templates)
+    elapsed = time.perf_counter() - start
+    print(f"✅ Enrolled {len(names)} people from {len(tasks) - rejected} images "
+          f"({rejected} rejected) in {elapsed:.1f}s, {len(tasks) / elapsed:.1f} images/sec")
+    return names
 
 if __name__ == "__main__":
-    # Register Elon Musk's face
-    register_face("srujan.jpg", "srujan")
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Register faces into the gallery")
+    parser.add_argument('image', nargs='?', help="image with exactly one face")
+    parser.add_argument('name', nargs='?', help="name to register the face under")
+    parser.add_argument('--bulk', help="folder of person_name/*.jpg sub-folders")
+    parser.add_argument('--remove', nargs='+', metavar='NAME', help="revoke these identities")
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--profile', help="FaceRecognizer profile, e.g. cpu-fast")
+    parser.add_argument('--db', default='face_db')
+    parser.add_argument('--min-images', type=int, default=1)
+    parser.add_argument('--outlier-threshold', type=float, default=0.5)
+    parser.add_argument('--cache', default='embedding_cache.db', help="embedding cache database")
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+    cache_path = None if args.no_cache else args.cache
+    if args.remove:
+        removed = FaceDatabase(args.db).remove_faces(args.remove)
+        print(f"Removed {removed} of {len(args.remove)} identities from {args.db}")
+    elif args.bulk:
+        enroll_directory(args.bulk, args.workers, args.profile, args.db, args.min_images,
+                         args.outlier_threshold, cache_path)
+    elif args.image and args.name:
+        register_face(args.image, args.name, cache_path)
+    else:
+        parser.error("give an image and a name, --bulk FOLDER or --remove NAME")
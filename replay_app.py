@@ -0,0 +1,244 @@
+import argparse
+import json
+import queue
+import threading
+import time
+from datetime import datetime, timedelta
+
+import cv2
+import numpy as np
+from model_registry import get_recognizer, get_database
+from tracker import IoUTracker
+from motion import MotionGate
+from detection_logger import DetectionLogger
+from webcam_app import FRAME_SIZE, embed_full_resolution, get_access_status, get_face_centers, get_zone_map
+
+class VideoFileReader:
+    """Decodes a video file on its own thread into a bounded queue. Unlike
+    LatestFrameCapture nothing is dropped: when analysis is slower than decoding,
+    the decoder waits. Frames skipped by `stride` are only grabbed, never decoded
+    into images, and `start` seeks straight to the nearest keyframe."""
+
+    def __init__(self, path, stride=1, start=None, end=None, queue_size=32):
+        self.cap = cv2.VideoCapture(path)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        self.frame_count = int(self.cap.get(cv2.CAP_PROP_FRAME_COUNT))
+        self.stride = max(1, stride)
+        self.start_time = start or 0.0
+        self.end_time = end
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._stop = threading.Event()
+        self._thread = None
+        self.frames_decoded = 0
+        self.frames_skipped = 0
+
+    def isOpened(self):
+        return self.cap.isOpened()
+
+    @property
+    def duration(self):
+        return self.frame_count / self.fps if self.frame_count > 0 else None
+
+    def start(self):
+        if self.start_time:
+            self.cap.set(cv2.CAP_PROP_POS_MSEC, self.start_time * 1000)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def _put(self, item):
+        while not self._stop.is_set():
+            try:
+                self._queue.put(item, timeout=0.5)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def _run(self):
+        index = int(self.cap.get(cv2.CAP_PROP_POS_FRAMES))
+        while not self._stop.is_set():
+            if not self.cap.grab():
+                break
+            # Position of the frame just grabbed, in seconds of video time
+            video_time = self.cap.get(cv2.CAP_PROP_POS_MSEC) / 1000
+            if video_time <= 0 and index > 0:
+                video_time = index / self.fps
+            if self.end_time is not None and video_time > self.end_time:
+                break
+            if video_time < self.start_time or (index - int(self.start_time * self.fps)) % self.stride:
+                self.frames_skipped += 1
+            else:
+                ret, frame = self.cap.retrieve()
+                if not ret:
+                    break
+                self.frames_decoded += 1
+                if not self._put((index, video_time, frame)):
+                    break
+            index += 1
+        self._put(None)
+
+    def frames(self):
+        """Yields (frame_index, video_time, frame) in order until the range ends"""
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            yield item
+
+    def release(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+        self.cap.release()
+
+def format_video_time(seconds):
+    return str(timedelta(seconds=round(seconds, 3)))
+
+def replay_video(video_path, output_path='replay_detections.jsonl', stride=1, start=None, end=None,
+                 profile=None, recorded_at=None, db_path=None, refresh_interval=2.0,
+                 keepalive_interval=1.0, report_every=10.0, two_scale=False, quantize=None):
+    """
+    Runs recognition and zone checks over a recorded video as fast as the CPU allows.
+
+    Args:
+        video_path (str): Video file to analyse
+        output_path (str): JSONL log of detections and violations keyed to video time
+        stride (int): Analyse every Nth frame; the others are grabbed without decoding
+        start, end (float): Optional time range in seconds of video time
+        profile (str): FaceRecognizer profile, e.g. "cpu-fast"
+        recorded_at (datetime): When the recording started; with db_path, rows are also
+            written to detections.db at recorded_at + video time
+        refresh_interval, keepalive_interval (float): Tracker refresh and motion gate
+            keep-alive, both measured in video time
+        two_scale (bool): Detect on the FRAME_SIZE canvas but embed on the full-resolution frame
+        quantize (str): Match against a 'float16' or 'int8' copy of the gallery
+
+    Returns:
+        dict: Frames, detections, violations and video-seconds per wall-second
+    """
+    recognizer = get_recognizer(profile=profile)
+    database = get_database(quantize=quantize)
+    tracker = IoUTracker(refresh_interval=refresh_interval)
+    gate = MotionGate(keepalive_interval=keepalive_interval)
+    logger = DetectionLogger(db_path).start() if db_path and recorded_at else None
+
+    reader = VideoFileReader(video_path, stride, start, end)
+    if not reader.isOpened():
+        print(f"Error: Could not open video {video_path}")
+        return None
+    reader.start()
+    print(f"▶️ Replaying {video_path} ({reader.fps:.1f} fps"
+          + (f", {format_video_time(reader.duration)}" if reader.duration else "") + f"), stride {reader.stride}")
+
+    frame = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    faces, tracks = [], []
+    counts = {'frames': 0, 'detections': 0, 'violations': 0}
+    first_time = last_time = None
+    wall_start = last_report = time.perf_counter()
+
+    with open(output_path, 'w', encoding='utf-8') as out:
+        def write(record):
+            out.write(json.dumps(record) + '\n')
+            counts[record['type'] + 's'] += 1
+            if logger is not None:
+                timestamp = (recorded_at + timedelta(seconds=record['video_time'])).isoformat(
+                    sep=' ', timespec='milliseconds')
+                if record['type'] == 'detection':
+                    logger.log_detection(record['name'], record['status'], record['zone'],
+                                         record['is_violation'], record['score'], tuple(record['center']),
+                                         {"video": video_path, "video_time": record['video_time'],
+                                          "track_id": record['track_id']}, timestamp=timestamp)
+                else:
+                    logger.log_violation(record['name'], record['zone'], "restricted_zone_entry",
+                                         {"video": video_path, "video_time": record['video_time'],
+                                          "track_id": record['track_id'], "bbox": record['bbox']},
+                                         timestamp=timestamp)
+
+        for index, video_time, raw_frame in reader.frames():
+            first_time = video_time if first_time is None else first_time
+            last_time = video_time
+            counts['frames'] += 1
+            cv2.resize(raw_frame, FRAME_SIZE, dst=frame)
+            zone_map = get_zone_map(FRAME_SIZE)
+
+            # Same detection path as process_webcam, with video time as the clock
+            stale = []
+            if gate.should_process(frame, zone_map.veil_mask, now=video_time):
+                masked = zone_map.mask_veil(frame)
+                crop, offset = zone_map.crop_visible(masked)
+                faces = recognizer.detect(crop, offset=offset) if crop is not None else []
+                in_veil = zone_map.in_zone(get_face_centers(faces), "veil")
+                faces = [face for face, veiled in zip(faces, in_veil) if not veiled]
+                tracks = tracker.update(faces)
+                stale = [track for track in tracks if tracker.needs_recognition(track, now=video_time)]
+                if stale:
+                    if two_scale and raw_frame.shape[:2] != frame.shape[:2]:
+                        embed_full_resolution(recognizer, raw_frame, [track.face for track in stale])
+                    else:
+                        recognizer.embed(masked, [track.face for track in stale])
+                    matches = database.recognize_faces([track.face.embedding for track in stale])
+                    for track, (name, score) in zip(stale, matches):
+                        tracker.set_identity(track, name, score, now=video_time)
+
+            centers = get_face_centers(faces)
+            in_restricted = zone_map.in_zone(centers, "restricted")
+            for face, track, is_in_restricted, center in zip(faces, tracks, in_restricted, centers):
+                status, _ = get_access_status(track.name, is_in_restricted)
+                is_violation = status == "RESTRICTED" and bool(is_in_restricted)
+                zone_type = "restricted" if is_in_restricted else "general"
+                record = {"video_time": round(video_time, 3), "frame": index,
+                          "track_id": track.track_id, "name": track.name, "zone": zone_type,
+                          "bbox": [int(v) for v in face.bbox.astype(int)]}
+                # One detection per recognition, one violation when it starts
+                if track in stale:
+                    write(dict(record, type="detection", status=status, is_violation=is_violation,
+                               score=float(track.score), center=[int(center[0]), int(center[1])]))
+                if is_violation and not track.violation:
+                    write(dict(record, type="violation"))
+                track.violation = is_violation
+
+            if time.perf_counter() - last_report >= report_every:
+                print_replay_progress(video_time, first_time, wall_start, reader)
+                last_report = time.perf_counter()
+
+    reader.release()
+    if logger is not None:
+        logger.close()
+    wall = time.perf_counter() - wall_start
+    video_seconds = (last_time - first_time) if first_time is not None else 0.0
+    result = dict(counts, video_seconds=round(video_seconds, 3), wall_seconds=round(wall, 3),
+                  speed=round(video_seconds / wall, 2) if wall > 0 else 0.0,
+                  frames_skipped=reader.frames_skipped, frames_gated=gate.gated,
+                  recognitions=tracker.recognitions)
+    print(f"✅ {counts['frames']} frames, {format_video_time(video_seconds)} of video in {wall:.1f}s "
+          f"({result['speed']}x realtime): {counts['detections']} detections, "
+          f"{counts['violations']} violations -> {output_path}")
+    return result
+
+def print_replay_progress(video_time, first_time, wall_start, reader):
+    """Print video position and video-seconds processed per wall-second"""
+    wall = time.perf_counter() - wall_start
+    speed = (video_time - first_time) / wall if wall > 0 else 0.0
+    print(f"⏱️ {format_video_time(video_time)} reached, {speed:.1f} video-s/wall-s, "
+          f"{reader.frames_decoded} decoded, {reader.frames_skipped} skipped")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline detection over recorded video")
+    parser.add_argument('video')
+    parser.add_argument('--output', default='replay_detections.jsonl')
+    parser.add_argument('--stride', type=int, default=1, help="analyse every Nth frame")
+    parser.add_argument('--start', type=float, help="start at this many seconds (keyframe seek)")
+    parser.add_argument('--end', type=float, help="stop at this many seconds")
+    parser.add_argument('--profile', help="FaceRecognizer profile, e.g. cpu-fast")
+    parser.add_argument('--recorded-at', type=datetime.fromisoformat,
+                        help="recording start time, e.g. '2026-10-18 09:00:00'; needed for --db")
+    parser.add_argument('--db', help="also log detections to this database, e.g. detections.db")
+    parser.add_argument('--two-scale', action='store_true',
+                        help="embed faces on the full-resolution frame instead of the resized one")
+    parser.add_argument('--quantize', choices=('float16', 'int8'), help="compact gallery representation")
+    args = parser.parse_args()
+    if args.db and not args.recorded_at:
+        parser.error("--db needs --recorded-at to turn video time into timestamps")
+    replay_video(args.video, args.output, args.stride, args.start, args.end, args.profile,
+                 args.recorded_at, args.db, two_scale=args.two_scale, quantize=args.quantize)
@@ -0,0 +1,408 @@
+import json
+import multiprocessing
+import os
+import time
+from multiprocessing import shared_memory
+
+import cv2
+import numpy as np
+
+# Control block fields (int64), padded to CTRL_FIELDS
+MAGIC, HEIGHT, WIDTH, CHANNELS, SLOTS, WRITE_SEQ, CLOSED, META_SIZE, WRITER_PID = range(9)
+CTRL_FIELDS = 16
+RING_MAGIC = 0x46524D52  # "FRMR"
+
+def _align(offset, alignment=64):
+    return (offset + alignment - 1) // alignment * alignment
+
+def _attach(name):
+    """Opens an existing segment without letting this process's resource tracker
+    unlink it on exit (only the creator owns the segment)"""
+    try:
+        return shared_memory.SharedMemory(name=name, track=False)
+    except TypeError:  # Python < 3.13 registers every attach; drop this segment's registration
+        from multiprocessing import resource_tracker
+        shm = shared_memory.SharedMemory(name=name)
+        resource_tracker.unregister(shm._name, 'shared_memory')
+        return shm
+
+def _pid_alive(pid):
+    if pid <= 0:
+        return False
+    if os.name == 'nt':  # Windows frees a segment with its last handle, so its writer is alive
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def _create(name, size):
+    """Creates a segment, replacing one left behind by a writer that crashed. A
+    segment whose recorded writer is still running is left alone."""
+    try:
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+    except FileExistsError:
+        stale = _attach(name)
+        pid = 0
+        if stale.size >= CTRL_FIELDS * 8:
+            pid = int(np.ndarray((CTRL_FIELDS,), dtype=np.int64, buffer=stale.buf)[WRITER_PID])
+        if _pid_alive(pid):
+            stale.close()
+            raise FileExistsError(f"Shared-memory segment {name} is in use by writer pid {pid}")
+        print(f"⚠️ Removing stale shared-memory segment {name}")
+        stale.close()
+        _unlink(stale)
+        return shared_memory.SharedMemory(name=name, create=True, size=size)
+
+def _unlink(shm):
+    """Unlinks a segment. A reader in the same process tree shares the creator's
+    resource tracker and may have dropped the registration, so restore it first;
+    unlink() then unregisters it exactly once."""
+    try:
+        from multiprocessing import resource_tracker
+        resource_tracker.register(shm._name, 'shared_memory')
+    except (AttributeError, ImportError):  # no tracker on this platform
+        pass
+    shm.unlink()
+
+class FrameRing:
+    """Fixed-slot ring of frames in one shared-memory segment.
+
+    The writer fills slot `seq % slots` in place and publishes it seqlock style:
+    the slot's sequence number is negated while it is being written and set to
+    `seq` once complete, then the ring's write sequence advances. Readers take
+    zero-copy views and call valid(seq) after using one to confirm the writer
+    has not lapped the ring and reused the slot meanwhile."""
+
+    def __init__(self, shm, owner=False):
+        self.shm = shm
+        self.owner = owner
+        self.ctrl = np.ndarray((CTRL_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        if self.ctrl[MAGIC] != RING_MAGIC:
+            raise ValueError(f"{shm.name} is not a frame ring")
+        height, width, channels, slots, meta_size = (int(self.ctrl[i]) for i in
+                                                     (HEIGHT, WIDTH, CHANNELS, SLOTS, META_SIZE))
+        self.shape = (height, width, channels)
+        self.slots = slots
+        offset = CTRL_FIELDS * 8
+        self.slot_seq = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.slot_time = np.ndarray((slots,), dtype=np.float64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.meta_len = np.ndarray((slots,), dtype=np.int64, buffer=shm.buf, offset=offset)
+        offset += slots * 8
+        self.meta = np.ndarray((slots, meta_size), dtype=np.uint8, buffer=shm.buf, offset=offset)
+        offset = _align(offset + slots * meta_size)
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=shm.buf, offset=offset)
+
+    @staticmethod
+    def size_for(shape, slots, meta_size):
+        header = _align(CTRL_FIELDS * 8 + slots * 24 + slots * meta_size)
+        return header + slots * int(np.prod(shape))
+
+    @classmethod
+    def create(cls, name, shape, slots=8, meta_size=65536):
+        """Creates the segment; the creating process is the single writer and owner"""
+        shm = _create(name, cls.size_for(shape, slots, meta_size))
+        ctrl = np.ndarray((CTRL_FIELDS,), dtype=np.int64, buffer=shm.buf)
+        ctrl[:] = 0
+        ctrl[WRITER_PID] = os.getpid()
+        ctrl[HEIGHT], ctrl[WIDTH], ctrl[CHANNELS] = shape
+        ctrl[SLOTS], ctrl[META_SIZE] = slots, meta_size
+        ctrl[MAGIC] = RING_MAGIC  # last, so readers never see a half-initialised header
+        ring = cls(shm, owner=True)
+        ring.slot_seq[:] = 0
+        return ring
+
+    @classmethod
+    def attach(cls, name, timeout=10.0):
+        """Attaches to a ring, waiting up to `timeout` for its writer to create it"""
+        deadline = time.monotonic() + timeout
+        while True:
+            try:
+                return cls(_attach(name))
+            except (FileNotFoundError, ValueError):
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(0.05)
+
+    # Writer side
+
+    def begin_write(self):
+        """Claims the next slot; returns (seq, writable view of its frame)"""
+        seq = int(self.ctrl[WRITE_SEQ]) + 1
+        slot = seq % self.slots
+        self.slot_seq[slot] = -seq  # readers treat the slot as being rewritten
+        return seq, self.frames[slot]
+
+    def commit(self, seq, timestamp, meta=None):
+        slot = seq % self.slots
+        self.slot_time[slot] = timestamp
+        data = json.dumps(meta).encode() if meta is not None else b""
+        if len(data) > self.meta.shape[1]:
+            data = b""  # too large for the slot; frames matter more than metadata
+        self.meta_len[slot] = len(data)
+        self.meta[slot, :len(data)] = np.frombuffer(data, dtype=np.uint8)
+        self.slot_seq[slot] = seq
+        self.ctrl[WRITE_SEQ] = seq
+
+    def write(self, frame, timestamp=None, meta=None):
+        """Copies a frame into the next slot (resizing it if the shape differs)"""
+        seq, view = self.begin_write()
+        if frame.shape != view.shape:
+            cv2.resize(frame, (self.shape[1], self.shape[0]), dst=view)
+        else:
+            np.copyto(view, frame)
+        self.commit(seq, time.monotonic() if timestamp is None else timestamp, meta)
+        return seq
+
+    def close_stream(self):
+        self.ctrl[CLOSED] = 1
+
+    # Reader side
+
+    @property
+    def latest_seq(self):
+        return int(self.ctrl[WRITE_SEQ])
+
+    @property
+    def closed(self):
+        return bool(self.ctrl[CLOSED])
+
+    def valid(self, seq):
+        """True while the slot still holds frame `seq`"""
+        return seq > 0 and int(self.slot_seq[seq % self.slots]) == seq
+
+    def get(self, seq):
+        """Returns (frame view, timestamp, meta) for `seq`, or None if it was overwritten"""
+        slot = seq % self.slots
+        if int(self.slot_seq[slot]) != seq:
+            return None
+        frame, timestamp = self.frames[slot], float(self.slot_time[slot])
+        length = int(self.meta_len[slot])
+        meta = json.loads(self.meta[slot, :length].tobytes()) if length else None
+        if not self.valid(seq):
+            return None
+        return frame, timestamp, meta
+
+    def wait(self, after_seq, timeout=5.0, poll=0.001):
+        """Waits for a frame newer than `after_seq`; returns its seq, or None on timeout/close"""
+        deadline = time.monotonic() + timeout
+        while True:
+            seq = self.latest_seq
+            if seq > after_seq:
+                return seq
+            if self.closed or time.monotonic() >= deadline:
+                return None
+            time.sleep(poll)
+
+    def close(self):
+        # Drop the numpy views before closing the mapping
+        self.ctrl = self.slot_seq = self.slot_time = self.meta_len = self.meta = self.frames = None
+        self.shm.close()
+        if self.owner:
+            _unlink(self.shm)
+
+class SharedFrameSource:
+    """Drop-in for LatestFrameCapture that reads a ring written by another process.
+    read() returns a zero-copy view of the newest frame; skipped sequence numbers
+    are counted as dropped, and frames the writer overwrote while the consumer was
+    still using them are counted as torn."""
+
+    def __init__(self, name, timeout=10.0):
+        self.name = name
+        self.ring = FrameRing.attach(name, timeout)
+        self._last_seq = 0
+        # Counters, as in LatestFrameCapture
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.frames_read = 0
+        self.frames_torn = 0
+        self.staleness_total = 0.0
+        self.staleness_max = 0.0
+        self.latency_total = 0.0
+        self.latency_max = 0.0
+        self.latency_count = 0
+
+    def isOpened(self):
+        return self.ring is not None
+
+    @property
+    def ended(self):
+        """True once the writer has closed the ring and every frame was read"""
+        return self.ring.closed and self.ring.latest_seq <= self._last_seq
+
+    def frame_valid(self):
+        """True while the view returned by the last read() has not been overwritten"""
+        return self.ring.valid(self._last_seq)
+
+    def start(self):
+        return self
+
+    def read(self, timeout=5.0):
+        """Returns (ret, frame view, captured_at) for the newest frame"""
+        # The previous frame must have survived until the consumer came back for more
+        if self._last_seq and not self.ring.valid(self._last_seq):
+            self.frames_torn += 1
+        while True:
+            seq = self.ring.wait(self._last_seq, timeout)
+            if seq is None:
+                return False, None, None
+            entry = self.ring.get(seq)
+            if entry is not None:
+                break
+            self._last_seq = seq - 1  # lapped while reading; try the next one
+        self.frames_dropped += seq - self._last_seq - 1 if self._last_seq else 0
+        self.frames_captured = seq
+        self._last_seq = seq
+        frame, captured_at, _ = entry
+        self.frames_read += 1
+        staleness = time.monotonic() - captured_at
+        self.staleness_total += staleness
+        self.staleness_max = max(self.staleness_max, staleness)
+        return True, frame, captured_at
+
+    def record_latency(self, captured_at):
+        latency = time.monotonic() - captured_at
+        self.latency_total += latency
+        self.latency_max = max(self.latency_max, latency)
+        self.latency_count += 1
+
+    def stats(self):
+        return {
+            'captured': self.frames_captured,
+            'dropped': self.frames_dropped,
+            'read': self.frames_read,
+            'torn': self.frames_torn,
+            'drop_rate': self.frames_dropped / max(self.frames_captured, 1),
+            'staleness_avg_ms': 1000 * self.staleness_total / max(self.frames_read, 1),
+            'staleness_max_ms': 1000 * self.staleness_max,
+            'latency_avg_ms': 1000 * self.latency_total / max(self.latency_count, 1),
+            'latency_max_ms': 1000 * self.latency_max,
+        }
+
+    def release(self):
+        self.ring.close()
+
+class SharedFrameSink:
+    """Drop-in for the frame bus on the publishing side: annotated frames and their
+    detections go into a ring that rendering/streaming processes read from.
+    Reader processes use the same class's latest()/wait()/is_closed(), so it can
+    also be handed to MJPEGBroadcaster in place of the frame bus."""
+
+    def __init__(self, name, shape=None, slots=8, create=True):
+        self.name = name
+        self.ring = FrameRing.create(name, shape, slots) if create else FrameRing.attach(name)
+
+    @classmethod
+    def open(cls, name, timeout=10.0):
+        """Reader-side handle for a sink created by another process"""
+        sink = cls.__new__(cls)
+        sink.name = name
+        sink.ring = FrameRing.attach(name, timeout)
+        return sink
+
+    def publish(self, camera_id, frame, detections=()):
+        return self.ring.write(frame, time.time(), {'camera': camera_id, 'detections': list(detections)})
+
+    def close(self, camera_id=None, reason="stopped"):
+        self.ring.close_stream()
+
+    def is_closed(self, camera_id=None):
+        return self.ring.closed
+
+    def latest(self, camera_id=None):
+        """Returns (seq, frame view, detections, published_at) or None"""
+        seq = self.ring.latest_seq
+        entry = self.ring.get(seq) if seq else None
+        if entry is None:
+            return None
+        frame, published_at, meta = entry
+        return seq, frame, (meta or {}).get('detections', []), published_at
+
+    def wait(self, camera_id=None, after_seq=0, timeout=5.0):
+        seq = self.ring.wait(after_seq, timeout)
+        if seq is None:
+            return None
+        entry = self.ring.get(seq)
+        if entry is None:
+            return None
+        frame, published_at, meta = entry
+        return seq, frame, (meta or {}).get('detections', []), published_at
+
+    def release(self):
+        self.ring.close()
+
+def run_capture(source, name, slots=8, ready=None, stop=None):
+    """Capture process body: decodes `source` straight into ring slots until the
+    stream ends or `stop` is set. The ring takes the shape of the first frame."""
+    cap = cv2.VideoCapture(source)
+    ret, frame = cap.read()
+    if not ret:
+        print(f"Error: Could not open video source {source}")
+        if ready is not None:
+            ready.set()
+        return
+    ring = FrameRing.create(name, frame.shape, slots)
+    ring.write(frame)
+    if ready is not None:
+        ready.set()
+    try:
+        while stop is None or not stop.is_set():
+            if not cap.grab():
+                break
+            captured_at = time.monotonic()
+            seq, view = ring.begin_write()
+            # Decode into the slot itself when the frame fits, otherwise copy/resize
+            ret, decoded = cap.retrieve(view)
+            if not ret:
+                break
+            if decoded is not view and not np.shares_memory(decoded, view):
+                if decoded.shape != view.shape:
+                    cv2.resize(decoded, (view.shape[1], view.shape[0]), dst=view)
+                else:
+                    np.copyto(view, decoded)
+            ring.commit(seq, captured_at)
+    finally:
+        ring.close_stream()
+        cap.release()
+        # Give readers a moment to see the close before the segment disappears
+        time.sleep(0.5)
+        ring.close()
+
+def start_capture_process(source, name, slots=8, timeout=30.0):
+    """Starts run_capture in its own process; returns (process, stop event)"""
+    ctx = multiprocessing.get_context('spawn')
+    ready, stop = ctx.Event(), ctx.Event()
+    process = ctx.Process(target=run_capture, args=(source, name, slots, ready, stop), daemon=True)
+    process.start()
+    ready.wait(timeout)
+    return process, stop
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Shared-memory frame transport between processes")
+    sub = parser.add_subparsers(dest='command', required=True)
+    capture = sub.add_parser('capture', help="decode a camera or video into a frame ring")
+    capture.add_argument('source', help="camera index, RTSP URL or video file")
+    capture.add_argument('--name', required=True, help="ring name, e.g. cam0")
+    capture.add_argument('--slots', type=int, default=8)
+    analyze = sub.add_parser('analyze', help="run process_webcam on a frame ring")
+    analyze.add_argument('--name', required=True, help="ring written by 'capture'")
+    analyze.add_argument('--output', help="publish annotated frames to this ring instead of a window")
+    analyze.add_argument('--profile', help="FaceRecognizer profile, e.g. cpu-fast")
+    args = parser.parse_args()
+    if args.command == 'capture':
+        source = int(args.source) if args.source.isdigit() else args.source
+        print(f"📷 Capturing {args.source} into ring '{args.name}'")
+        run_capture(source, args.name, args.slots)
+    else:
+        from webcam_app import FRAME_SIZE, process_webcam
+        sink = SharedFrameSink(args.output, (FRAME_SIZE[1], FRAME_SIZE[0], 3)) if args.output else None
+        process_webcam(camera_id=args.name, headless=sink is not None, bus=sink, profile=args.profile,
+                       capture=SharedFrameSource(args.name))
+        if sink is not None:
+            sink.release()
@@ -0,0 +1,92 @@
+import itertools
+import time
+
+import numpy as np
+
+def iou_matrix(boxes_a, boxes_b):
+    """Pairwise IoU between two arrays of [x1, y1, x2, y2] boxes"""
+    a = np.asarray(boxes_a, dtype=np.float32).reshape(-1, 4)[:, None, :]
+    b = np.asarray(boxes_b, dtype=np.float32).reshape(-1, 4)[None, :, :]
+    w = np.clip(np.minimum(a[..., 2], b[..., 2]) - np.maximum(a[..., 0], b[..., 0]), 0, None)
+    h = np.clip(np.minimum(a[..., 3], b[..., 3]) - np.maximum(a[..., 1], b[..., 1]), 0, None)
+    inter = w * h
+    area_a = (a[..., 2] - a[..., 0]) * (a[..., 3] - a[..., 1])
+    area_b = (b[..., 2] - b[..., 0]) * (b[..., 3] - b[..., 1])
+    return inter / np.maximum(area_a + area_b - inter, 1e-6)
+
+class Track:
+    """A face followed across frames, with its cached identity"""
+
+    def __init__(self, track_id, face):
+        self.track_id = track_id
+        self.face = face
+        self.missed = 0
+        self.name = None
+        self.score = 0.0
+        self.confidence = 0.0  # association confidence since the last recognition
+        self.recognized_at = None
+        self.violation = False  # whether the last frame had this face in violation
+
+class IoUTracker:
+    """Greedy IoU association between consecutive detections. Each track caches the
+    name and score from its last recognition; `needs_recognition` says when that
+    cache has to be refreshed."""
+
+    def __init__(self, iou_threshold=0.3, steady_iou=0.7, max_missed=5, refresh_interval=2.0,
+                 min_confidence=0.5):
+        self.iou_threshold = iou_threshold
+        self.steady_iou = steady_iou
+        self.max_missed = max_missed
+        self.refresh_interval = refresh_interval
+        self.min_confidence = min_confidence
+        self.tracks = []
+        self._ids = itertools.count()
+        # Cache accounting
+        self.lookups = 0
+        self.recognitions = 0
+
+    def update(self, faces):
+        """Associates this frame's faces with tracks; returns one track per face, in order"""
+        assigned = [None] * len(faces)
+        if self.tracks and faces:
+            ious = iou_matrix([t.face.bbox for t in self.tracks], [f.bbox for f in faces])
+            # Greedy: best remaining pair first
+            for flat in np.argsort(-ious, axis=None):
+                ti, fi = np.unravel_index(flat, ious.shape)
+                if ious[ti, fi] < self.iou_threshold:
+                    break
+                track = self.tracks[ti]
+                if assigned[fi] is not None or track.missed < 0:
+                    continue
+                track.face = faces[fi]
+                # Weak overlaps (fast motion, occlusion) erode trust in the cached identity
+                track.confidence *= min(1.0, float(ious[ti, fi]) / self.steady_iou)
+                track.missed = -1  # matched this frame
+                assigned[fi] = track
+        for track in self.tracks:
+            track.missed = 0 if track.missed < 0 else track.missed + 1
+        self.tracks = [t for t in self.tracks if t.missed <= self.max_missed]
+        for fi, face in enumerate(faces):
+            if assigned[fi] is None:
+                assigned[fi] = Track(next(self._ids), face)
+                self.tracks.append(assigned[fi])
+        self.lookups += len(faces)
+        return assigned
+
+    def needs_recognition(self, track, now=None):
+        """True for new tracks, decayed confidence, or an expired refresh interval"""
+        now = time.monotonic() if now is None else now
+        return (track.recognized_at is None
+                or track.confidence < self.min_confidence
+                or now - track.recognized_at >= self.refresh_interval)
+
+    def set_identity(self, track, name, score, now=None):
+        track.name = name
+        track.score = score
+        track.confidence = 1.0
+        track.recognized_at = time.monotonic() if now is None else now
+        self.recognitions += 1
+
+    @property
+    def cache_hit_rate(self):
+        return 1.0 - self.recognitions / max(self.lookups, 1)
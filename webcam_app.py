@@ -1,9 +1,18 @@
 import cv2
 import numpy as np
-from face_detector import FaceDetector
-from face_recognizer import FaceRecognizer
-from database_manager import FaceDatabase
+import model_registry
+from model_registry import get_recognizer, get_database
+from capture import LatestFrameCapture
+from tracker import IoUTracker
+from motion import MotionGate
+from zone_map import ZoneLabelMap
+from overlay import OverlayLayer
+from frame_bus import frame_bus
+from detection_logger import get_detection_logger
+from zones import NORMALIZED_ZONES, normalize_zones, scale_zones
+from metrics import FACES_BUCKETS, StageTimer, metrics_registry
 from threading import Lock
+import time
 
 # Global configuration
 ACCESS_LEVELS = {
@@ -12,13 +21,16 @@ ACCESS_LEVELS = {
     "Unknown": "general"
 }
 
-# Zone management
-current_zones = {
-    "general": [np.array([[0, 0], [400, 0], [400, 600], [0, 600]], dtype=np.int32)],  # Left half
-    "restricted": [np.array([[400, 0], [800, 0], [800, 600], [400, 600]], dtype=np.int32)],  # Right half
-    "veil": []  # New zone type for no-detection areas
-}
+# Display/analysis canvas; zones are edited in its pixel coordinates
+FRAME_SIZE = (800, 600)
+
+# Zone management: zones.py's normalized zones mapped onto the canvas
+current_zones = scale_zones(NORMALIZED_ZONES, FRAME_SIZE)  # general: left half, restricted: right half
+current_zones.setdefault("veil", [])  # New zone type for no-detection areas
 zone_lock = Lock()
+zone_version = 0  # bumped on every zone edit; compiled zone maps are rebuilt when it changes
+_zone_maps = {}  # frame size -> (zone_version, ZoneLabelMap)
+_overlay_layers = {}  # (name, frame size) -> (cache key, OverlayLayer)
 edit_mode = False
 current_zone_type = "general"
 dragging = False
@@ -27,24 +39,28 @@ selected_corner_idx = -1
 
 def draw_zones(frame):
     """Visualize zones with transparency"""
-    overlay = frame.copy()
+    # Snapshot once so the whole drawing sees one consistent set of zones
     with zone_lock:
-        for zone_type, polygons in current_zones.items():
-            if zone_type == "general":
-                color = (0, 255, 255)  # Yellow
-                for poly in polygons:
-                    cv2.fillPoly(overlay, [poly], color)
-                    cv2.polylines(overlay, [poly], True, (255,255,255), 2)
-            elif zone_type == "restricted":
-                color = (0, 0, 255)  # Red
-                for poly in polygons:
-                    cv2.fillPoly(overlay, [poly], color)
-                    cv2.polylines(overlay, [poly], True, (255,255,255), 2)
-            else:  # veil
-                # Draw veil zones with higher opacity
-                for poly in polygons:
-                    cv2.fillPoly(overlay, [poly], (0, 0, 0))
-                    cv2.polylines(overlay, [poly], True, (255,255,255), 2)
+        zones = {zone_type: [poly.copy() for poly in polygons]
+                 for zone_type, polygons in current_zones.items()}
+    
+    overlay = frame.copy()
+    for zone_type, polygons in zones.items():
+        if zone_type == "general":
+            color = (0, 255, 255)  # Yellow
+            for poly in polygons:
+                cv2.fillPoly(overlay, [poly], color)
+                cv2.polylines(overlay, [poly], True, (255,255,255), 2)
+        elif zone_type == "restricted":
+            color = (0, 0, 255)  # Red
+            for poly in polygons:
+                cv2.fillPoly(overlay, [poly], color)
+                cv2.polylines(overlay, [poly], True, (255,255,255), 2)
+        else:  # veil
+            # Draw veil zones with higher opacity
+            for poly in polygons:
+                cv2.fillPoly(overlay, [poly], (0, 0, 0))
+                cv2.polylines(overlay, [poly], True, (255,255,255), 2)
     
     # Blend with original - different blend for veil zones
     # First blend normal zones
@@ -52,10 +68,9 @@ def draw_zones(frame):
     
     # Then add veil zones with higher opacity
     veil_overlay = frame.copy()
-    with zone_lock:
-        for poly in current_zones["veil"]:
-            cv2.fillPoly(veil_overlay, [poly], (0, 0, 0))
-            cv2.polylines(veil_overlay, [poly], True, (255,255,255), 2)
+    for poly in zones["veil"]:
+        cv2.fillPoly(veil_overlay, [poly], (0, 0, 0))
+        cv2.polylines(veil_overlay, [poly], True, (255,255,255), 2)
     cv2.addWeighted(veil_overlay, 0.7, frame, 0.3, 0, frame)
     
     # Draw zone labels
@@ -71,6 +86,53 @@ def draw_zones(frame):
                    (50, 570), cv2.FONT_HERSHEY_SIMPLEX, 0.7, (0, 255, 0), 2)
     return frame
 
+def get_overlay_layer(name, draw, size, key=None):
+    """Cached rendering of a static overlay, rebuilt only when `key` changes"""
+    cached = _overlay_layers.get((name, size))
+    if cached is None or cached[0] != key:
+        cached = (key, OverlayLayer(draw, size))
+        _overlay_layers[(name, size)] = cached
+    return cached[1]
+
+def get_zone_layer(size=FRAME_SIZE):
+    """Zone overlay layer, re-rendered only after zone edits or an edit mode toggle"""
+    with zone_lock:
+        version = zone_version
+    return get_overlay_layer("zones", draw_zones, size, (version, edit_mode))
+
+def get_help_layer(size=FRAME_SIZE):
+    """Help overlay layer; it never changes, so it is rendered once per size"""
+    return get_overlay_layer("help", draw_help_overlay, size)
+
+def mark_zones_changed():
+    """Invalidate compiled zone maps; call with zone_lock held after editing zones"""
+    global zone_version
+    zone_version += 1
+
+def get_zone_map(size=FRAME_SIZE):
+    """Zone label map for a frame size, recompiled only after zone edits. Zones are
+    mapped from the canvas through normalized coordinates, so any resolution works."""
+    with zone_lock:
+        cached = _zone_maps.get(size)
+        if cached is None or cached[0] != zone_version:
+            zones = current_zones if size == FRAME_SIZE else scale_zones(
+                normalize_zones(current_zones, FRAME_SIZE), size)
+            cached = (zone_version, ZoneLabelMap(zones, size))
+            _zone_maps[size] = cached
+    return cached[1]
+
+def embed_full_resolution(recognizer, raw_frame, faces):
+    """Embeds faces detected on the FRAME_SIZE canvas using the original frame's
+    pixels (veil zones masked at that resolution); faces keep canvas coordinates"""
+    height, width = raw_frame.shape[:2]
+    masked = get_zone_map((width, height)).mask_veil(raw_frame)
+    return recognizer.embed(masked, faces, scale=(width / FRAME_SIZE[0], height / FRAME_SIZE[1]))
+
+def get_face_centers(faces):
+    """Center points of all face bounding boxes as an (N, 2) array"""
+    boxes = np.array([face.bbox for face in faces], dtype=np.float32).reshape(-1, 4)
+    return ((boxes[:, :2] + boxes[:, 2:]) / 2).astype(int)
+
 def get_face_center(face):
     """Calculate center point of face bounding box"""
     bbox = face.bbox.astype(int)
@@ -105,7 +167,9 @@ def mouse_callback(event, x, y, flags, param):
     
     # Drag corner
     elif event == cv2.EVENT_MOUSEMOVE and dragging:
-        zones[selected_zone_idx][selected_corner_idx] = [x, y]
+        with zone_lock:
+            zones[selected_zone_idx][selected_corner_idx] = [x, y]
+            mark_zones_changed()
     
     # Release
     elif event == cv2.EVENT_LBUTTONUP:
@@ -189,79 +253,210 @@ def get_access_status(name, is_in_restricted):
 
 def is_in_veil_zone(x, y):
     """Check if a point is in any veil zone"""
-    with zone_lock:
-        for zone in current_zones["veil"]:
-            point = np.array([x, y], dtype=np.float32)
-            if cv2.pointPolygonTest(zone, (point[0], point[1]), False) >= 0:
-                return True
-    return False
+    return bool(get_zone_map(FRAME_SIZE).in_zone([(x, y)], "veil")[0])
+
+def print_capture_stats(capture):
+    """Print dropped-frame and staleness counters for sizing hardware"""
+    stats = capture.stats()
+    print(f"Capture: {stats['captured']} decoded, {stats['dropped']} dropped "
+          f"({stats['drop_rate']:.0%}), staleness avg {stats['staleness_avg_ms']:.0f}ms "
+          f"max {stats['staleness_max_ms']:.0f}ms, end-to-end avg {stats['latency_avg_ms']:.0f}ms "
+          f"max {stats['latency_max_ms']:.0f}ms")
+
+def print_tracker_stats(tracker):
+    """Print how often cached identities saved an embedding + gallery lookup"""
+    print(f"Tracker: {tracker.lookups} faces, {tracker.recognitions} recognitions, "
+          f"cache hit rate {tracker.cache_hit_rate:.0%}")
+
+def print_gate_stats(gate):
+    """Print the share of frames the motion gate kept away from the face models"""
+    print(f"Motion gate: {gate.gated}/{gate.frames} frames skipped ({gate.gated_fraction:.0%})")
+
+def print_logger_stats(logger):
+    """Print detection writer throughput and drops"""
+    stats = logger.stats()
+    print(f"Detection log: {stats['written']} written, {stats['backlog']} queued, "
+          f"{stats['dropped']} dropped")
+
+def register_metrics(registry, camera_id, cap, tracker, gate, logger):
+    """Exposes the counters the pipeline components already keep; read only when scraped"""
+    registry.callback("theft_frames_captured_total", "counter", "Frames decoded from the camera",
+                      lambda: cap.frames_captured, camera=camera_id)
+    registry.callback("theft_frames_dropped_total", "counter",
+                      "Decoded frames replaced by a newer one before being processed",
+                      lambda: cap.frames_dropped, camera=camera_id)
+    registry.callback("theft_frames_gated_total", "counter", "Frames the motion gate kept from the face models",
+                      lambda: gate.gated, camera=camera_id)
+    registry.callback("theft_recognitions_total", "counter", "Faces embedded and matched against the gallery",
+                      lambda: tracker.recognitions, camera=camera_id)
+    registry.callback("theft_recognition_cache_hit_ratio", "gauge",
+                      "Share of tracked faces that reused a cached identity",
+                      lambda: tracker.cache_hit_rate, camera=camera_id)
+    registry.callback("theft_detection_log_backlog", "gauge", "Rows queued for the detections.db writer",
+                      lambda: logger.backlog, db=logger.db_path)
+    registry.callback("theft_detection_log_dropped_total", "counter", "Rows the detections.db writer dropped",
+                      lambda: logger.dropped, db=logger.db_path)
 
-def process_webcam(ip_address=None):
-    """Main webcam processing function"""
+def process_webcam(ip_address=None, stats_interval=30.0, refresh_interval=2.0, keepalive_interval=1.0,
+                   headless=False, camera_id=None, bus=None, stop_event=None, logger=None, profile=None,
+                   metrics=None, two_scale=False, scheduler=None, weight=1.0, capture=None, quantize=None):
+    """Main webcam processing function.
+
+    With headless=True no window is opened; annotated frames and detection results
+    are published to `bus` (the shared frame_bus by default) under `camera_id`
+    until the stream ends or `stop_event` is set. Recognitions and violations are
+    queued to `logger` (the shared detections.db writer by default). `profile` picks a
+    FaceRecognizer performance profile such as "cpu-fast". Stage latencies and
+    counters are recorded in `metrics` (the shared metrics_registry by default).
+    With two_scale=True faces are still detected on the FRAME_SIZE canvas, but
+    aligned and embedded on the camera's full-resolution frame. With a shared
+    `scheduler` (inference_server.InferenceScheduler) detection and embedding run
+    on its thread, batched with the other cameras; `weight` is this camera's share.
+    `scheduler` may also be a factory such as inference_server.get_scheduler, called
+    here so a first-time model load happens on this thread, not the caller's.
+    `capture` replaces the camera reader with another frame source of the same
+    interface, e.g. shm_transport.SharedFrameSource fed by a separate capture
+    process; a shm_transport.SharedFrameSink can likewise be passed as `bus`.
+    `quantize` ('float16'/'int8') matches against a compact copy of the gallery.
+    """
     global edit_mode, current_zone_type
+    camera_id = camera_id or str(ip_address or 0)
+    if bus is None and headless:
+        bus = frame_bus
+    if metrics is None:
+        metrics = metrics_registry
     
-    # Initialize components
-    detector = FaceDetector()
-    recognizer = FaceRecognizer()
-    database = FaceDatabase()
+    if callable(scheduler):
+        scheduler = scheduler()
+    # Shared, already-warm models when another stream loaded them first
+    recognizer = scheduler.client(camera_id, weight) if scheduler else get_recognizer(profile=profile)
+    database = get_database(quantize=quantize)
+    # Caches identities per tracked face so embeddings are only recomputed when stale
+    tracker = IoUTracker(refresh_interval=refresh_interval)
+    # Skips the face models on frames without motion outside veil zones
+    gate = MotionGate(keepalive_interval=keepalive_interval)
+    # Background writer; logging never blocks this loop
+    if logger is None:
+        logger = get_detection_logger()
     
-    # Initialize webcam with provided IP or default
-    if ip_address:
-        cap = cv2.VideoCapture(ip_address)
-    else:
-        cap = cv2.VideoCapture(0)
+    # Initialize webcam with provided IP or default; frames are decoded on their own thread
+    cap = capture if capture is not None else LatestFrameCapture(ip_address if ip_address else 0)
         
     if not cap.isOpened():
         print("Error: Could not open webcam")
+        if scheduler:
+            recognizer.close()
+        if bus is not None:
+            bus.close(camera_id, "Could not open video stream")
         return
+    cap.start()
     
-    cv2.namedWindow("Warehouse Security")
-    cv2.setMouseCallback("Warehouse Security", mouse_callback)
+    register_metrics(metrics, camera_id, cap, tracker, gate, logger)
+    stages = StageTimer(metrics, camera_id)
+    frames_processed = metrics.counter("theft_frames_processed_total", "Frames run through the pipeline",
+                                       camera=camera_id)
+    faces_per_frame = metrics.histogram("theft_faces_per_frame", "Faces found per analysed frame",
+                                        FACES_BUCKETS, camera=camera_id)
+    frame_latency = metrics.histogram("theft_frame_latency_seconds",
+                                      "Capture to published frame, end to end", camera=camera_id)
+    camera_up = metrics.gauge("theft_camera_up", "1 while the camera's analysis loop runs", camera=camera_id)
+    camera_up.set(1)
     
-    show_help = True  # Start with help visible
+    if not headless:
+        cv2.namedWindow("Warehouse Security")
+        cv2.setMouseCallback("Warehouse Security", mouse_callback)
+    
+    show_help = not headless  # Start with help visible on screen
     edit_mode = False  # Start in non-edit mode
+    last_stats = time.monotonic()
+    faces, tracks = [], []  # reused on frames the motion gate skips
+    first_frame = True
+    # Preallocated buffers: resized input and the annotated output
+    frame = np.empty((FRAME_SIZE[1], FRAME_SIZE[0], 3), dtype=np.uint8)
+    vis_frame = np.empty_like(frame)
     
     while True:
-        ret, frame = cap.read()
+        # Always the freshest decoded frame; older ones are counted as dropped
+        stages.start()
+        ret, raw_frame, captured_at = cap.read()
         if not ret:
-            print("Error: Could not read frame from webcam")
-            break
+            if stop_event is not None and stop_event.is_set():
+                break
+            if cap.ended:
+                print("Error: Could not read frame from webcam")
+                break
+            # A stall, not the end of the stream: keep waiting for the camera
+            print("⚠️ No frame from the camera for 5s, still waiting")
+            continue
+        stages.lap("capture_wait")
         
         # Resize frame
-        frame = cv2.resize(frame, (800, 600))
-        vis_frame = frame.copy()
+        cv2.resize(raw_frame, FRAME_SIZE, dst=frame)
+        stages.lap("resize")
         
-        # Draw zones
-        vis_frame = draw_zones(vis_frame)
+        # Draw zones from the cached layer straight into the output buffer
+        get_zone_layer(FRAME_SIZE).composite(frame, out=vis_frame)
+        stages.lap("overlay")
         
+        detections = []
+        stale = []
         # Process faces (only when not editing for better performance)
         if not edit_mode:
             try:
-                faces = recognizer.model.get(frame)
-                for face in faces:
-                    x_center, y_center = get_face_center(face)
+                zone_map = get_zone_map(FRAME_SIZE)
+                # Idle frames keep the previous faces and tracks
+                process = gate.should_process(frame, zone_map.veil_mask)
+                stages.lap("motion_gate")
+                if process:
+                    # Black out veil zones and only hand the visible region to the detector
+                    masked = zone_map.mask_veil(frame)
+                    crop, offset = zone_map.crop_visible(masked)
+                    # Detection only; embeddings are computed below for stale tracks alone
+                    faces = recognizer.detect(crop, offset=offset) if crop is not None else []
                     
                     # Skip detection if face is in veil zone
-                    if is_in_veil_zone(x_center, y_center):
-                        continue
+                    in_veil = zone_map.in_zone(get_face_centers(faces), "veil")
+                    faces = [face for face, veiled in zip(faces, in_veil) if not veiled]
+                    stages.lap("detect")
+                    faces_per_frame.observe(len(faces))
                     
-                    name = database.recognize_face(face.embedding)
+                    tracks = tracker.update(faces)
+                    stale = [track for track in tracks if tracker.needs_recognition(track)]
+                    if stale:
+                        if two_scale and raw_frame.shape[:2] != frame.shape[:2]:
+                            embed_full_resolution(recognizer, raw_frame, [track.face for track in stale])
+                            if not cap.frame_valid():
+                                # A shared-memory writer reused the slot mid-embed; fall
+                                # back to the canvas, which was copied out before that
+                                recognizer.embed(masked, [track.face for track in stale])
+                        else:
+                            recognizer.embed(masked, [track.face for track in stale])
+                        # Match every stale face in the frame against the gallery in one call
+                        matches = database.recognize_faces([track.face.embedding for track in stale])
+                        for track, (name, score) in zip(stale, matches):
+                            tracker.set_identity(track, name, score)
+                    stages.lap("recognize")
+                
+                # First check which zone each person is in, all faces in one lookup
+                centers = get_face_centers(faces)
+                in_restricted = zone_map.in_zone(centers, "restricted")
+                for face, track, is_in_restricted, center in zip(faces, tracks, in_restricted, centers):
+                    name, score = track.name, track.score
                     
                     # Draw face box and name
                     bbox = face.bbox.astype(int)
                     x1, y1, x2, y2 = bbox
                     
-                    # First check which zone the person is in
-                    is_in_restricted = False
-                    with zone_lock:
-                        for zone in current_zones["restricted"]:
-                            point = np.array([x_center, y_center], dtype=np.float32)
-                            if cv2.pointPolygonTest(zone, (point[0], point[1]), False) >= 0:
-                                is_in_restricted = True
-                                break
-                    
                     # Get access status based on zone first, then check permissions
                     status, color = get_access_status(name, is_in_restricted)
+                    detections.append({
+                        "track_id": track.track_id,
+                        "name": name,
+                        "score": float(score),
+                        "bbox": [int(v) for v in bbox],
+                        "status": status,
+                        "in_restricted": bool(is_in_restricted),
+                    })
                     
                     # Draw face box
                     cv2.rectangle(vis_frame, (x1, y1), (x2, y2), color, 2)
@@ -289,8 +484,22 @@ def process_webcam(ip_address=None):
                                cv2.FONT_HERSHEY_SIMPLEX, 0.7, color, 2)
                     
                     # Log violation if needed
-                    if status == "RESTRICTED" and is_in_restricted:
+                    is_violation = status == "RESTRICTED" and is_in_restricted
+                    if is_violation:
                         print(f"Alert: {name} in restricted zone")
+                    
+                    # Store each recognition, and each violation when it starts
+                    zone_type = "restricted" if is_in_restricted else "general"
+                    if track in stale:
+                        logger.log_detection(name, status, zone_type, is_violation, float(score),
+                                             (int(center[0]), int(center[1])),
+                                             {"camera": camera_id, "track_id": track.track_id})
+                    if is_violation and not track.violation:
+                        logger.log_violation(name, zone_type, "restricted_zone_entry",
+                                             {"camera": camera_id, "track_id": track.track_id,
+                                              "bbox": [int(v) for v in bbox]})
+                    track.violation = is_violation
+                stages.lap("annotate")
             except Exception as e:
                 print(f"Error processing faces: {str(e)}")
                 import traceback
@@ -298,10 +507,33 @@ def process_webcam(ip_address=None):
         
         # Show help overlay if enabled
         if show_help:
-            vis_frame = draw_help_overlay(vis_frame)
+            get_help_layer(FRAME_SIZE).composite(vis_frame, out=vis_frame)
+        
+        # Display frame, or hand it to the web app
+        if bus is not None:
+            bus.publish(camera_id, vis_frame, detections)
+        if not headless:
+            cv2.imshow("Warehouse Security", vis_frame)
+        stages.lap("publish")
+        cap.record_latency(captured_at)
+        frame_latency.observe(time.monotonic() - captured_at)
+        frames_processed.inc()
+        if first_frame:
+            model_registry.mark(f"first frame {camera_id}")
+            # Time-to-first-frame is only known now, after preload's report
+            model_registry.startup_report()
+            first_frame = False
+        if time.monotonic() - last_stats >= stats_interval:
+            print_capture_stats(cap)
+            print_tracker_stats(tracker)
+            print_gate_stats(gate)
+            print_logger_stats(logger)
+            last_stats = time.monotonic()
         
-        # Display frame
-        cv2.imshow("Warehouse Security", vis_frame)
+        if headless:
+            if stop_event is not None and stop_event.is_set():
+                break
+            continue
         
         # Handle key controls
         key = cv2.waitKey(1)
@@ -330,6 +562,7 @@ def process_webcam(ip_address=None):
                 with zone_lock:
                     if current_zones[current_zone_type]:
                         current_zones[current_zone_type].pop(0)  # Remove from front (top layer)
+                        mark_zones_changed()
                         print(f"Removed top {current_zone_type} zone")
         elif key == ord('n'):  # New zone
             if edit_mode:  # Only allow new zones in edit mode
@@ -350,16 +583,28 @@ def process_webcam(ip_address=None):
                     
                     # Insert at the beginning of the list to make it appear on top
                     current_zones[current_zone_type].insert(0, new_zone)
+                    mark_zones_changed()
                     print(f"Added new {current_zone_type} zone on top")
         elif key == ord('c'):  # Clear all zones of current type
             if edit_mode:  # Only allow clearing in edit mode
                 with zone_lock:
                     current_zones[current_zone_type] = []
+                    mark_zones_changed()
                     print(f"Cleared all {current_zone_type} zones")
     
     # Cleanup
+    print_capture_stats(cap)
+    print_tracker_stats(tracker)
+    print_gate_stats(gate)
+    print_logger_stats(logger)
+    camera_up.set(0)
+    if scheduler:
+        recognizer.close()
     cap.release()
-    cv2.destroyAllWindows()
+    if bus is not None:
+        bus.close(camera_id)
+    if not headless:
+        cv2.destroyAllWindows()
 
 if __name__ == "__main__":
     process_webcam()
\ No newline at end of file
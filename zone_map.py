@@ -0,0 +1,56 @@
+import cv2
+import numpy as np
+
+# One bit per zone type so overlapping zones keep every membership
+ZONE_BITS = {"general": 1, "restricted": 2, "veil": 4}
+
+class ZoneLabelMap:
+    """Zones compiled into a per-pixel bitmask for one frame size, so membership
+    of any number of points is a single array index regardless of polygon count."""
+
+    def __init__(self, zones, size):
+        width, height = size
+        self.size = size
+        self.labels = np.zeros((height, width), dtype=np.uint8)
+        layer = np.empty_like(self.labels)
+        for zone_type, polygons in zones.items():
+            if not polygons:
+                continue
+            layer.fill(0)
+            cv2.fillPoly(layer, [np.asarray(p, dtype=np.int32) for p in polygons], ZONE_BITS[zone_type])
+            np.bitwise_or(self.labels, layer, out=self.labels)
+        self.veil_mask = (self.labels & ZONE_BITS["veil"]) > 0
+        self.has_veil = bool(self.veil_mask.any())
+        # Bounding box of everything that is not veiled, for cropping before inference
+        ys, xs = np.nonzero(~self.veil_mask)
+        if len(xs):
+            self.visible_box = (int(xs.min()), int(ys.min()), int(xs.max()) + 1, int(ys.max()) + 1)
+        else:
+            self.visible_box = None
+
+    def labels_at(self, points):
+        """Zone bitmask for each (x, y) point; points outside the frame are clamped"""
+        points = np.asarray(points, dtype=np.int64).reshape(-1, 2)
+        height, width = self.labels.shape
+        xs = np.clip(points[:, 0], 0, width - 1)
+        ys = np.clip(points[:, 1], 0, height - 1)
+        return self.labels[ys, xs]
+
+    def in_zone(self, points, zone_type):
+        """Boolean membership of each point in any polygon of `zone_type`"""
+        return (self.labels_at(points) & ZONE_BITS[zone_type]) > 0
+
+    def mask_veil(self, frame):
+        """Returns the frame with veiled pixels blacked out (the frame itself if none)"""
+        if not self.has_veil:
+            return frame
+        masked = frame.copy()
+        masked[self.veil_mask] = 0
+        return masked
+
+    def crop_visible(self, frame):
+        """Returns (crop, (x, y) offset) covering only the non-veiled part of the frame"""
+        if self.visible_box is None:
+            return None, (0, 0)
+        x1, y1, x2, y2 = self.visible_box
+        return frame[y1:y2, x1:x2], (x1, y1)
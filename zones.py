@@ -1,3 +1,9 @@
+import numpy as np
+
+# ZONES below are in pixels of this reference frame; use NORMALIZED_ZONES (0..1
+# coordinates) with scale_zones() to get them for any other frame size
+ZONE_REFERENCE_SIZE = (1920, 1080)
+
 ZONES = {
     "general": [
         [(0, 0), (960, 0), (960, 1080), (0, 1080)]  # Left half
@@ -12,6 +18,21 @@ ZONE_COLORS = {
     "restricted": (0, 0, 255)   # Red
 }
 
+def normalize_zones(zones, size):
+    """Pixel polygons drawn on a frame of `size` -> polygons in 0..1 coordinates"""
+    scale = np.array(size, dtype=np.float32)
+    return {zone_type: [np.asarray(poly, dtype=np.float32).reshape(-1, 2) / scale for poly in polygons]
+            for zone_type, polygons in zones.items()}
+
+def scale_zones(zones, size):
+    """Normalized polygons -> int32 pixel polygons for a frame of `size`"""
+    scale = np.array(size, dtype=np.float32)
+    return {zone_type: [np.round(np.asarray(poly, dtype=np.float32) * scale).astype(np.int32)
+                        for poly in polygons]
+            for zone_type, polygons in zones.items()}
+
+NORMALIZED_ZONES = normalize_zones(ZONES, ZONE_REFERENCE_SIZE)
+
 ACCESS_LEVELS = {
     "niraj": "general",
     "sovit": "general"